@@ -64,8 +64,10 @@ setup(
     extras_require={
         'docs': ['Sphinx', 'sphinx-autobuild', 'alabaster'],
         'quality': ['pylama', 'isort', 'eradicate', 'mypy', 'black', 'bandit'],
+        'speedups': ['orjson'],
     },
     install_requires=[
+        "cachetools",
         "oidcmsg>=1.1.0",
         "jinja2",
         "pyyaml",
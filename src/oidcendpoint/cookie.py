@@ -4,10 +4,13 @@ import json
 import logging
 import os
 import sys
+import threading
 import time
 from http.cookies import SimpleCookie
 from urllib.parse import urlparse
 
+from cachetools import LRUCache
+from cachetools import cached
 from cryptography.exceptions import InvalidTag
 from cryptojwt import b64d
 from cryptojwt.exception import VerificationError
@@ -544,6 +547,17 @@ class CookieDealer(object):
         return cookie
 
 
+@cached(LRUCache(maxsize=1024), lock=threading.Lock())
+def _session_state_prefix(client_id, redirect_uri):
+    """
+    A SHA-256 hash object that has consumed the client dependent part of
+    the session state. Must be copied before it's updated.
+    """
+    parsed_uri = urlparse(redirect_uri)
+    rp_origin_url = "{uri.scheme}://{uri.netloc}".format(uri=parsed_uri)
+    return hashlib.sha256((client_id + " " + rp_origin_url + " ").encode("utf-8"))
+
+
 def compute_session_state(opbs, salt, client_id, redirect_uri):
     """
     Computes a session state value.
@@ -556,10 +570,9 @@ def compute_session_state(opbs, salt, client_id, redirect_uri):
     :param redirect_uri:
     :return: Session state value
     """
-    parsed_uri = urlparse(redirect_uri)
-    rp_origin_url = "{uri.scheme}://{uri.netloc}".format(uri=parsed_uri)
-    session_str = client_id + " " + rp_origin_url + " " + opbs + " " + salt
-    return hashlib.sha256(session_str.encode("utf-8")).hexdigest() + "." + salt
+    _hash = _session_state_prefix(client_id, redirect_uri).copy()
+    _hash.update((opbs + " " + salt).encode("utf-8"))
+    return _hash.hexdigest() + "." + salt
 
 
 def create_session_cookie(name, opbs, **kwargs):
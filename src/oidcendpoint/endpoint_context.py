@@ -1,5 +1,6 @@
 import logging
 import os
+from http.cookiejar import DefaultCookiePolicy
 
 from oidcmsg.storage.init import init_storage
 import requests
@@ -25,6 +26,21 @@ from oidcendpoint.util import importer
 logger = logging.getLogger(__name__)
 
 
+def http_session():
+    """
+    A requests session for the outbound requests made on behalf of clients.
+
+    The session is shared by all clients, and by the threads sending
+    back-channel logout requests. So it must not keep cookies, a response
+    from one RP must never add cookies to requests sent to another. With
+    no cookies the only state used is urllib3's connection pool, which is
+    thread safe.
+    """
+    _session = requests.Session()
+    _session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return _session
+
+
 def add_path(url, path):
     if url.endswith("/"):
         if path.startswith("/"):
@@ -124,7 +140,9 @@ class EndpointContext(OidcContext):
         # Default values, to be changed below depending on configuration
         self.endpoint = {}
         self.issuer = ""
-        self.httpc = httpc or requests
+        # A session keeps connections to the same host alive between requests
+        self._http_session = None if httpc else http_session()
+        self.httpc = httpc or self._http_session
         self.jwks_uri = None
         self.sso_ttl = 14400  # 4h
         self.symkey = rndstr(24)
@@ -414,6 +432,14 @@ class EndpointContext(OidcContext):
 
         return _provider_info
 
+    def httpc_is_thread_safe(self):
+        """
+        Whether httpc may be used from several threads at once. That is only
+        known for the HTTP session created here, not for one supplied by the
+        deployer.
+        """
+        return self.httpc is not None and self.httpc is self._http_session
+
     def set(self, key, val):
         setattr(self, key, val)
 
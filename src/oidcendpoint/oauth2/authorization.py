@@ -1,10 +1,18 @@
-import json
+import copy
 import logging
+import secrets
+import threading
+from html import escape
+from types import MappingProxyType
 from typing import Union
+from urllib.parse import parse_qs
 from urllib.parse import unquote
 from urllib.parse import urlencode
-from urllib.parse import urlparse
+from urllib.parse import urlsplit
+from urllib.parse import urlunsplit
 
+from cachetools import LRUCache
+from cachetools import TTLCache
 from cryptojwt import BadSyntax
 from cryptojwt import as_unicode
 from cryptojwt import b64d
@@ -19,12 +27,11 @@ from oidcmsg.message import Message
 from oidcmsg.oidc import verified_claim_name
 from oidcmsg.time_util import utc_time_sans_frac
 
-from oidcendpoint import rndstr
 from oidcendpoint.authn_event import create_authn_event
-from oidcendpoint.cookie import append_cookie
 from oidcendpoint.cookie import compute_session_state
 from oidcendpoint.cookie import new_cookie
 from oidcendpoint.endpoint import Endpoint
+from oidcendpoint.exception import FailedAuthentication
 from oidcendpoint.exception import InvalidRequest
 from oidcendpoint.exception import NoSuchAuthentication
 from oidcendpoint.exception import RedirectURIError
@@ -37,25 +44,31 @@ from oidcendpoint.session import Revoked
 from oidcendpoint.session import unpack_session_key
 from oidcendpoint.token.exception import UnknownToken
 from oidcendpoint.user_authn.authn_context import pick_auth
-from oidcendpoint.util import split_uri
+from oidcendpoint.util import json_dumps
+from oidcendpoint.util import json_loads
 
 logger = logging.getLogger(__name__)
 
 # For the time being. This is JAR specific and should probably be configurable.
-ALG_PARAMS = {
-    "sign": [
+ALG_PARAMS = MappingProxyType({
+    "sign": (
         "request_object_signing_alg",
         "request_object_signing_alg_values_supported",
-    ],
-    "enc_alg": [
+    ),
+    "enc_alg": (
         "request_object_encryption_alg",
         "request_object_encryption_alg_values_supported",
-    ],
-    "enc_enc": [
+    ),
+    "enc_enc": (
         "request_object_encryption_enc",
         "request_object_encryption_enc_values_supported",
-    ],
-}
+    ),
+})
+
+# How long a verified request object fetched by reference may be reused
+REQUEST_URI_CACHE_TTL = 60
+# Seconds to wait for a client to deliver a request object
+REQUEST_URI_TIMEOUT = 10
 
 FORM_POST = """<html>
   <head>
@@ -68,16 +81,37 @@ FORM_POST = """<html>
   </body>
 </html>"""
 
+# FORM_POST split around its placeholders, so it needn't be parsed per response
+_FP_PRE, _rest = FORM_POST.split("{action}")
+_FP_MID, _FP_SUF = _rest.split("{inputs}")
+del _rest
+
 
 def inputs(form_args):
     """
     Creates list of input elements
     """
-    element = []
-    html_field = '<input type="hidden" name="{}" value="{}"/>'
-    for name, value in form_args.items():
-        element.append(html_field.format(name, value))
-    return "\n".join(element)
+    return "\n".join(
+        '<input type="hidden" name="{}" value="{}"/>'.format(
+            escape(name, quote=True), escape(str(value), quote=True)
+        )
+        for name, value in form_args.items()
+    )
+
+
+def _index_uris(uris):
+    _index = {}
+    for regbase, rquery in uris:
+        _index.setdefault(regbase, rquery)
+    return _index
+
+
+def _response_type_sets(response_types):
+    if not response_types:
+        # If no response_type is registered by the client then we'll
+        # use code.
+        return (frozenset(["code"]),)
+    return tuple(frozenset(rt.split(" ")) for rt in response_types)
 
 
 def max_age(request):
@@ -105,17 +139,17 @@ def verify_uri(endpoint_context, request, uri_type, client_id=None):
     else:
         logger.debug("Client ID: {}".format(_cid))
 
-    _redirect_uri = unquote(request[uri_type])
+    _redirect_uri = request[uri_type]
+    if "%" in _redirect_uri:
+        _redirect_uri = unquote(_redirect_uri)
 
-    part = urlparse(_redirect_uri)
+    part = urlsplit(_redirect_uri)
     if part.fragment:
         raise URIError("Contains fragment")
 
-    (_base, _query) = split_uri(_redirect_uri)
-    # if _query:
-    #     _query = parse_qs(_query)
+    _base = urlunsplit((part.scheme, part.netloc, part.path, "", ""))
+    _query = parse_qs(part.query) if part.query else {}
 
-    match = False
     # Get the clients registered redirect uris
     client_info = endpoint_context.cdb.get(_cid, {})
     if not client_info:
@@ -124,46 +158,52 @@ def verify_uri(endpoint_context, request, uri_type, client_id=None):
     redirect_uris = client_info.get("{}s".format(uri_type))
     if not redirect_uris:
         if _cid not in endpoint_context.cdb:
-            logger.debug("CIDs: {}".format(list(endpoint_context.cdb.keys())))
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("CIDs: {}".format(list(endpoint_context.cdb.keys())))
             raise KeyError("No such client")
         raise ValueError("No registered {}".format(uri_type))
-    else:
-        for regbase, rquery in redirect_uris:
-            # The URI MUST exactly match one of the Redirection URI
-            if _base == regbase:
-                # every registered query component must exist in the uri
-                if rquery:
-                    if not _query:
-                        raise ValueError("Missing query part")
-
-                    for key, vals in rquery.items():
-                        if key not in _query:
-                            raise ValueError('"{}" not in query part'.format(key))
-
-                        for val in vals:
-                            if val not in _query[key]:
-                                raise ValueError(
-                                    "{}={} value not in query part".format(key, val)
-                                )
-
-                # and vice versa, every query component in the uri
-                # must be registered
-                if _query:
-                    if not rquery:
-                        raise ValueError("No registered query part")
-
-                    for key, vals in _query.items():
-                        if key not in rquery:
-                            raise ValueError('"{}" extra in query part'.format(key))
-                        for val in vals:
-                            if val not in rquery[key]:
-                                raise ValueError(
-                                    "Extra {}={} value in query part".format(key, val)
-                                )
-                match = True
-                break
-        if not match:
-            raise RedirectURIError("Doesn't match any registered uris")
+
+    _index = _index_uris(redirect_uris)
+    # The URI MUST exactly match one of the Redirection URI
+    if _base not in _index:
+        raise RedirectURIError("Doesn't match any registered uris")
+
+    verify_uri_query(_query, _index[_base])
+
+
+def verify_uri_query(query, rquery):
+    """
+    Every registered query component must exist in the URI and vice versa.
+
+    :param query: The query part of the URI as a dictionary
+    :param rquery: The registered query part as a dictionary
+    """
+    if rquery:
+        if not query:
+            raise ValueError("Missing query part")
+
+        for key, vals in rquery.items():
+            if key not in query:
+                raise ValueError('"{}" not in query part'.format(key))
+
+            for val in vals:
+                if val not in query[key]:
+                    raise ValueError(
+                        "{}={} value not in query part".format(key, val)
+                    )
+
+    if query:
+        if not rquery:
+            raise ValueError("No registered query part")
+
+        for key, vals in query.items():
+            if key not in rquery:
+                raise ValueError('"{}" extra in query part'.format(key))
+            for val in vals:
+                if val not in rquery[key]:
+                    raise ValueError(
+                        "Extra {}={} value in query part".format(key, val)
+                    )
 
 
 def join_query(base, query):
@@ -210,6 +250,11 @@ def get_uri(endpoint_context, request, uri_type):
     return uri
 
 
+# Client and request attributes that are passed on to the authentication method
+_CINFO_AUTHN_ARGS = ("policy_uri", "logo_uri", "tos_uri")
+_REQUEST_AUTHN_ARGS = ("ui_locales", "acr_values", "login_hint")
+
+
 def authn_args_gather(request, authn_class_ref, cinfo, **kwargs):
     """
     Gather information to be used by the authentication method
@@ -230,33 +275,32 @@ def authn_args_gather(request, authn_class_ref, cinfo, **kwargs):
     elif isinstance(request, dict):
         authn_args["query"] = urlencode(request)
     else:
-        ValueError("Wrong request format")
+        raise ValueError("Wrong request format")
 
     if "req_user" in kwargs:
         authn_args["as_user"] = (kwargs["req_user"],)
 
     # Below are OIDC specific. Just ignore if OAuth2
     if cinfo:
-        for attr in ["policy_uri", "logo_uri", "tos_uri"]:
-            if cinfo.get(attr):
-                authn_args[attr] = cinfo[attr]
+        authn_args.update((a, cinfo[a]) for a in _CINFO_AUTHN_ARGS if cinfo.get(a))
 
-    for attr in ["ui_locales", "acr_values", "login_hint"]:
-        if request.get(attr):
-            authn_args[attr] = request[attr]
+    authn_args.update((a, request[a]) for a in _REQUEST_AUTHN_ARGS if request.get(a))
 
     return authn_args
 
 
 def check_unknown_scopes_policy(request_info, cinfo, endpoint_context):
     op_capabilities = endpoint_context.conf['capabilities']
-    client_allowed_scopes = cinfo.get('allowed_scopes') or \
-                            op_capabilities['scopes_supported']
+    if not op_capabilities.get('deny_unknown_scopes'):
+        return
+
+    client_allowed_scopes = frozenset(
+        cinfo.get('allowed_scopes') or op_capabilities['scopes_supported']
+    )
 
     # this prevents that authz would be released for unavailable scopes
     for scope in request_info['scope']:
-        if op_capabilities.get('deny_unknown_scopes') and \
-                scope not in client_allowed_scopes:
+        if scope not in client_allowed_scopes:
             _msg = '{} requested an unauthorized scope ({})'
             logger.warning(_msg.format(cinfo['client_id'],
                                        scope))
@@ -290,6 +334,11 @@ class Authorization(Endpoint):
         self.post_parse_request.append(self._do_request_uri)
         self.post_parse_request.append(self._post_parse_request)
         self.allowed_request_algorithms = AllowedAlgorithms(ALG_PARAMS)
+        # Verified request objects keyed on (request_uri, client_id)
+        self._req_uri_cache = TTLCache(maxsize=1024, ttl=REQUEST_URI_CACHE_TTL)
+        # HTTP cache validators and the raw response from earlier fetches
+        self._req_uri_validators = LRUCache(maxsize=1024)
+        self._req_uri_lock = threading.Lock()
 
     def filter_request(self, endpoint_context, req):
         return req
@@ -299,17 +348,16 @@ class Authorization(Endpoint):
 
     def verify_response_type(self, request, cinfo):
         # Checking response types
-        _registered = [set(rt.split(" ")) for rt in cinfo.get("response_types", [])]
-        if not _registered:
-            # If no response_type is registered by the client then we'll
-            # use code.
-            _registered = [{"code"}]
+        _registered = _response_type_sets(cinfo.get("response_types"))
 
         # Is the asked for response_type among those that are permitted
-        return set(request["response_type"]) in _registered
+        return frozenset(request["response_type"]) in _registered
 
-    def mint_token(self, token_type, grant, session_id, based_on=None):
-        _mngr = self.endpoint_context.session_manager
+    def _mint_token(self, token_type, grant, session_id, based_on=None):
+        """
+        Mint a token without storing the updated grant. The caller is expected
+        to do that once all tokens have been minted.
+        """
         usage_rules = grant.usage_rules.get(token_type, {})
 
         token = grant.mint_token(
@@ -326,9 +374,11 @@ class Authorization(Endpoint):
         if _exp_in:
             token.expires_at = utc_time_sans_frac() + _exp_in
 
-        self.endpoint_context.session_manager.set(unpack_session_key(session_id),
-                                                  grant)
+        return token
 
+    def mint_token(self, token_type, grant, session_id, based_on=None):
+        token = self._mint_token(token_type, grant, session_id, based_on=based_on)
+        self.endpoint_context.session_manager.set(unpack_session_key(session_id), grant)
         return token
 
     def _do_request_uri(self, request, client_id, endpoint_context, **kwargs):
@@ -358,42 +408,90 @@ class Authorization(Endpoint):
                 if _p[0] not in [l[0] for l in _registered]:
                     raise ValueError("A request_uri outside the registered")
 
-            # Fetch the request
-            _resp = endpoint_context.httpc.get(
-                _request_uri, **endpoint_context.httpc_params
-            )
-            if _resp.status_code == 200:
-                args = {"keyjar": endpoint_context.keyjar, "issuer": client_id}
-                _ver_request = self.request_cls().from_jwt(_resp.text, **args)
-                self.allowed_request_algorithms(
-                    client_id,
-                    endpoint_context,
-                    _ver_request.jws_header.get("alg", "RS256"),
-                    "sign",
-                )
-                if _ver_request.jwe_header is not None:
-                    self.allowed_request_algorithms(
-                        client_id,
-                        endpoint_context,
-                        _ver_request.jws_header.get("alg"),
-                        "enc_alg",
-                    )
-                    self.allowed_request_algorithms(
-                        client_id,
-                        endpoint_context,
-                        _ver_request.jws_header.get("enc"),
-                        "enc_enc",
-                    )
-                # The protected info overwrites the non-protected
-                for k, v in _ver_request.items():
-                    request[k] = v
+            _ver_request = self._fetch_request_uri(_request_uri, client_id, endpoint_context)
 
-                request[verified_claim_name("request")] = _ver_request
-            else:
-                raise ServiceError("Got a %s response", _resp.status)
+            # The protected info overwrites the non-protected
+            for k, v in _ver_request.items():
+                request[k] = v
+
+            request[verified_claim_name("request")] = _ver_request
 
         return request
 
+    def _fetch_request_uri(self, request_uri, client_id, endpoint_context):
+        """
+        Fetch and verify a request object passed by reference.
+
+        Verified request objects are kept for a short while, never beyond
+        their expiration time. If the client's server supports it a conditional
+        GET is used when the cached copy has gone stale.
+
+        :param request_uri: Where the request object can be found
+        :param client_id: Client ID
+        :param endpoint_context: An EndpointContext instance
+        :return: The verified request object
+        """
+        _key = (request_uri, client_id)
+        _now = utc_time_sans_frac()
+
+        with self._req_uri_lock:
+            _cached = self._req_uri_cache.get(_key)
+            _validators = self._req_uri_validators.get(_key)
+
+        if _cached and _cached[0] > _now:
+            # The client's allowed algorithms may have changed since
+            self.allowed_request_algorithms.check_many(client_id, endpoint_context, _cached[1])
+            return copy.deepcopy(_cached[2])
+
+        _params = endpoint_context.httpc_params
+        if "timeout" not in _params:
+            _params = dict(_params, timeout=REQUEST_URI_TIMEOUT)
+        if _validators:
+            _headers = {}
+            if _validators["etag"]:
+                _headers["If-None-Match"] = _validators["etag"]
+            if _validators["last_modified"]:
+                _headers["If-Modified-Since"] = _validators["last_modified"]
+            _params = dict(_params, headers=_headers)
+
+        # Fetch the request
+        _resp = endpoint_context.httpc.get(request_uri, **_params)
+        if _resp.status_code == 304 and _validators:
+            _jwt = _validators["text"]
+        elif _resp.status_code == 200:
+            _jwt = _resp.text
+            _etag = _resp.headers.get("ETag")
+            _last_modified = _resp.headers.get("Last-Modified")
+            if _etag or _last_modified:
+                with self._req_uri_lock:
+                    self._req_uri_validators[_key] = {
+                        "etag": _etag,
+                        "last_modified": _last_modified,
+                        "text": _jwt,
+                    }
+        else:
+            raise ServiceError("Got a %s response", _resp.status_code)
+
+        args = {"keyjar": endpoint_context.keyjar, "issuer": client_id}
+        _ver_request = self.request_cls().from_jwt(_jwt, **args)
+        _algs = {"sign": _ver_request.jws_header.get("alg", "RS256")}
+        if _ver_request.jwe_header is not None:
+            _algs["enc_alg"] = _ver_request.jwe_header.get("alg")
+            _algs["enc_enc"] = _ver_request.jwe_header.get("enc")
+        self.allowed_request_algorithms.check_many(client_id, endpoint_context, _algs)
+
+        if _ver_request.get("nbf", 0) <= _now:
+            _expires_at = _now + REQUEST_URI_CACHE_TTL
+            if "exp" in _ver_request:
+                _expires_at = min(_expires_at, _ver_request["exp"])
+            if _expires_at > _now:
+                with self._req_uri_lock:
+                    self._req_uri_cache[_key] = (
+                        _expires_at, _algs, copy.deepcopy(_ver_request)
+                    )
+
+        return _ver_request
+
     def _post_parse_request(self, request, client_id, endpoint_context, **kwargs):
         """
         Verify the authorization request.
@@ -438,6 +536,9 @@ class Authorization(Endpoint):
             )
         else:
             request["redirect_uri"] = redirect_uri
+            # Lets post_authentication know this URI has been verified. An
+            # attribute, not a claim, so it can not come from the client.
+            request._verified_redirect_uri = redirect_uri
 
         return request
 
@@ -473,6 +574,9 @@ class Authorization(Endpoint):
         :return:
         """
 
+        _context = self.endpoint_context
+        _mngr = _context.session_manager
+
         res = self.pick_authn_method(request, redirect_uri, acr, **kwargs)
 
         authn = res["method"]
@@ -501,15 +605,22 @@ class Authorization(Endpoint):
             _ts = 0
         else:
             if identity:
-                try:  # If identity['uid'] is in fact a base64 encoded JSON string
-                    _id = b64d(as_bytes(identity["uid"]))
-                except BadSyntax:
-                    pass
+                _id = as_bytes(identity["uid"])
+                # If identity['uid'] is in fact a base64 encoded JSON object.
+                # Those always start with 'ey', so don't bother decoding others.
+                if _id.startswith(b"ey"):
+                    try:
+                        _id = json_loads(b64d(_id))
+                    except (BadSyntax, ValueError):
+                        _id = None
                 else:
-                    identity = json.loads(as_unicode(_id))
+                    _id = None
+
+                if isinstance(_id, dict):
+                    identity = _id
 
                     try:
-                        _csi = self.endpoint_context.session_manager[identity.get("sid")]
+                        _csi = _mngr[identity.get("sid")]
                     except Revoked:
                         identity = None
                     else:
@@ -517,15 +628,13 @@ class Authorization(Endpoint):
                             identity = None
 
         authn_args = authn_args_gather(request, authn_class_ref, cinfo, **kwargs)
-        _mngr = self.endpoint_context.session_manager
         _session_id = ""
 
         # To authenticate or Not
         if identity is None:  # No!
             logger.info("No active authentication")
-            logger.debug(
-                "Known clients: {}".format(list(self.endpoint_context.cdb.keys()))
-            )
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Known clients: {}".format(list(_context.cdb.keys())))
 
             if "prompt" in request and "none" in request["prompt"]:
                 # Need to authenticate but not allowed
@@ -592,8 +701,7 @@ class Authorization(Endpoint):
             if _exp_in and "valid_until" in authn_event:
                 authn_event["valid_until"] = utc_time_sans_frac() + _exp_in
 
-            _token_usage_rules = self.endpoint_context.authz.usage_rules(
-                request["client_id"])
+            _token_usage_rules = _context.authz.usage_rules(request["client_id"])
             _session_id = _mngr.create_session(authn_event=authn_event, auth_req=request,
                                                user_id=user, client_id=request["client_id"],
                                                token_usage_rules=_token_usage_rules)
@@ -606,9 +714,14 @@ class Authorization(Endpoint):
     def response_mode(self, request, **kwargs):
         resp_mode = request["response_mode"]
         if resp_mode == "form_post":
-            msg = FORM_POST.format(
-                inputs=inputs(kwargs["response_args"].to_dict()),
-                action=kwargs["return_uri"],
+            msg = "".join(
+                (
+                    _FP_PRE,
+                    escape(kwargs["return_uri"], quote=True),
+                    _FP_MID,
+                    inputs(kwargs["response_args"].to_dict()),
+                    _FP_SUF,
+                )
             )
             kwargs.update(
                 {
@@ -656,57 +769,60 @@ class Authorization(Endpoint):
             fragment_enc = False
         else:
             _context = self.endpoint_context
-            _mngr = self.endpoint_context.session_manager
+            _mngr = _context.session_manager
             _sinfo = _mngr.get_session_info(sid, grant=True)
 
             if request.get("scope"):
                 aresp["scope"] = request["scope"]
 
-            rtype = set(request["response_type"][:])
-            handled_response_type = []
+            _rt = request["response_type"]
+            has_code = "code" in _rt
+            has_token = "token" in _rt
+            has_idt = "id_token" in _rt
+            not_handled = [r for r in _rt if r not in ("code", "token", "id_token")]
 
-            fragment_enc = True
-            if len(rtype) == 1 and "code" in rtype:
-                fragment_enc = False
+            # Only a plain 'code' response is returned in the query part
+            fragment_enc = not (has_code and not (has_token or has_idt or not_handled))
 
             grant = _sinfo["grant"]
 
-            if "code" in request["response_type"]:
-                _code = self.mint_token(
+            if has_code:
+                _code = self._mint_token(
                     token_type='authorization_code',
                     grant=grant,
-                    session_id= _sinfo["session_id"])
+                    session_id=sid)
                 aresp["code"] = _code.value
-                handled_response_type.append("code")
             else:
                 _code = None
 
-            if "token" in rtype:
+            if has_token:
                 if _code:
                     based_on = _code
                 else:
                     based_on = None
 
-                _access_token = self.mint_token(token_type="access_token",
-                                                grant=grant,
-                                                session_id=_sinfo["session_id"],
-                                                based_on=based_on)
+                _access_token = self._mint_token(token_type="access_token",
+                                                 grant=grant,
+                                                 session_id=sid,
+                                                 based_on=based_on)
                 aresp['access_token'] = _access_token.value
                 aresp['token_type'] = "Bearer"
                 if _access_token.expires_at:
                     aresp["expires_in"] = _access_token.expires_at - utc_time_sans_frac()
-                handled_response_type.append("token")
             else:
                 _access_token = None
 
-            if "id_token" in request["response_type"]:
+            # Store the grant once, with all the tokens minted above. This has
+            # to be done before the ID Token is made, since that reads it.
+            if _code or _access_token:
+                _mngr.set(unpack_session_key(sid), grant)
+
+            if has_idt:
                 kwargs = {}
-                if {"code", "id_token", "token"}.issubset(rtype):
-                    kwargs = {"code": _code.value, "access_token": _access_token.value}
-                elif {"code", "id_token"}.issubset(rtype):
-                    kwargs = {"code": _code.value}
-                elif {"id_token", "token"}.issubset(rtype):
-                    kwargs = {"access_token": _access_token.value}
+                if has_code:
+                    kwargs["code"] = _code.value
+                if has_token:
+                    kwargs["access_token"] = _access_token.value
 
                 try:
                     id_token = _context.idtoken.make(sid, **kwargs)
@@ -721,9 +837,7 @@ class Authorization(Endpoint):
                 aresp["id_token"] = id_token
                 _mngr.update([_sinfo["user_id"], _sinfo["client_id"]],
                              {"id_token": id_token})
-                handled_response_type.append("id_token")
 
-            not_handled = rtype.difference(handled_response_type)
             if not_handled:
                 resp = self.error_cls(
                     error="invalid_request", error_description="unsupported_response_type"
@@ -746,11 +860,12 @@ class Authorization(Endpoint):
         """
 
         response_info = {}
-        _mngr = self.endpoint_context.session_manager
+        _context = self.endpoint_context
+        _mngr = _context.session_manager
 
         # Do the authorization
         try:
-            grant = self.endpoint_context.authz(session_id, request=request)
+            grant = _context.authz(session_id, request=request)
         except ToOld as err:
             return self.error_response(
                 response_info,
@@ -770,21 +885,28 @@ class Authorization(Endpoint):
                     response_info, "server_error", "{}".format(err.args)
                 )
 
-        logger.debug("response type: %s" % request["response_type"])
+        logger.debug("response type: %s", request["response_type"])
 
         response_info = self.create_authn_response(request, session_id)
         response_info["session_id"] = session_id
 
-        logger.debug("Known clients: {}".format(list(self.endpoint_context.cdb.keys())))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Known clients: {}".format(list(_context.cdb.keys())))
 
-        try:
-            redirect_uri = get_uri(self.endpoint_context, request, "redirect_uri")
-        except (RedirectURIError, ParameterError) as err:
-            return self.error_response(
-                response_info, "invalid_request", "{}".format(err.args)
-            )
+        # No need to verify the redirect_uri again if _post_parse_request
+        # did it and it hasn't been changed since.
+        _verified = getattr(request, "_verified_redirect_uri", None)
+        if _verified and _verified == request.get("redirect_uri"):
+            response_info["return_uri"] = _verified
         else:
-            response_info["return_uri"] = redirect_uri
+            try:
+                redirect_uri = get_uri(_context, request, "redirect_uri")
+            except (RedirectURIError, ParameterError) as err:
+                return self.error_response(
+                    response_info, "invalid_request", "{}".format(err.args)
+                )
+            else:
+                response_info["return_uri"] = redirect_uri
 
         # Must not use HTTP unless implicit grant type and native application
         # info = self.aresp_check(response_info['response_args'], request)
@@ -792,10 +914,10 @@ class Authorization(Endpoint):
         #     return info
 
         _cookie = new_cookie(
-            self.endpoint_context,
+            _context,
             sid=session_id,
             state=request.get("state"),
-            cookie_name=self.endpoint_context.cookie_name["session"],
+            cookie_name=_context.cookie_name["session"],
         )
 
         # Now about the response_mode. Should not be set if it's obvious
@@ -844,7 +966,7 @@ class Authorization(Endpoint):
 
         if "check_session_iframe" in self.endpoint_context.provider_info:
             ec = self.endpoint_context
-            salt = rndstr()
+            salt = secrets.token_urlsafe(16)
             try:
                 authn_event = ec.session_manager.get_authentication_event(session_id)
             except KeyError:
@@ -853,9 +975,7 @@ class Authorization(Endpoint):
                 if authn_event.is_valid() is False:
                     return self.error_response({}, "server_error", "Authentication has timed out")
 
-            _state = b64e(
-                as_bytes(json.dumps({"authn_time": authn_event["authn_time"]}))
-            )
+            _state = b64e(json_dumps({"authn_time": authn_event["authn_time"]}))
 
             opbs_value = ''
             if hasattr(ec.cookie_dealer, 'create_cookie'):
@@ -887,13 +1007,8 @@ class Authorization(Endpoint):
             )
 
             if opbs_value and session_cookie:
-                if "cookie" in resp_info:
-                    if isinstance(resp_info["cookie"], list):
-                        resp_info["cookie"].append(session_cookie)
-                    else:
-                        append_cookie(resp_info["cookie"], session_cookie)
-                else:
-                    resp_info["cookie"] = session_cookie
+                # post_authentication always returns the cookies as a list
+                resp_info.setdefault("cookie", []).append(session_cookie)
 
             resp_info["response_args"]["session_state"] = _session_state
 
@@ -918,7 +1033,7 @@ class Authorization(Endpoint):
 
         _cid = request["client_id"]
         cinfo = self.endpoint_context.cdb[_cid]
-        logger.debug("client {}: {}".format(_cid, cinfo))
+        logger.debug("client %s: %s", _cid, cinfo)
 
         # this apply the default optionally deny_unknown_scopes policy
         if cinfo:
@@ -940,7 +1055,7 @@ class Authorization(Endpoint):
         _function = info.get("function")
         if not _function:
             logger.debug("- authenticated -")
-            logger.debug("AREQ keys: %s" % request.keys())
+            logger.debug("AREQ keys: %s", request.keys())
             return self.authz_part2(request=request, cookie=cookie, **info)
 
         try:
@@ -949,9 +1064,20 @@ class Authorization(Endpoint):
                 "http_response": _function(**info["args"]),
                 "return_uri": request["redirect_uri"],
             }
+        except (FailedAuthentication, InvalidRequest, ToOld) as err:
+            # Expected failures, no need for a stack trace
+            logger.error("Authentication failed: %s", err)
+            return {"http_response": f"Internal error: {err}"}
         except Exception as err:
             logger.exception(err)
-            return {"http_response": "Internal error: {}".format(err)}
+            return {"http_response": f"Internal error: {err}"}
+
+
+def _alg_set(allowed):
+    # Registered algorithms are single strings, supported ones lists
+    if isinstance(allowed, str):
+        return frozenset((allowed,))
+    return frozenset(allowed or ())
 
 
 class AllowedAlgorithms:
@@ -959,19 +1085,29 @@ class AllowedAlgorithms:
         self.algorithm_parameters = algorithm_parameters
 
     def __call__(self, client_id, endpoint_context, alg, alg_type):
+        self.check_many(client_id, endpoint_context, {alg_type: alg})
+
+    def check_many(self, client_id, endpoint_context, algs):
+        """
+        Verify several algorithms with one client/provider info lookup.
+
+        :param algs: Dictionary with algorithm type as key and the used
+            algorithm as value.
+        """
         _cinfo = endpoint_context.cdb[client_id]
         _pinfo = endpoint_context.provider_info
 
-        _reg, _sup = self.algorithm_parameters[alg_type]
-        _allowed = _cinfo.get(_reg)
-        if _allowed is None:
-            _allowed = _pinfo.get(_sup)
+        for alg_type, alg in algs.items():
+            _reg, _sup = self.algorithm_parameters[alg_type]
+            _allowed = _cinfo.get(_reg)
+            if _allowed is None:
+                _allowed = _pinfo.get(_sup)
 
-        if alg not in _allowed:
-            logger.error(
-                "Signing alg user: {} not among allowed: {}".format(alg, _allowed)
-            )
-            raise ValueError("Not allowed '%s' algorithm used", alg)
+            if alg not in _alg_set(_allowed):
+                logger.error(
+                    "Signing alg user: {} not among allowed: {}".format(alg, _allowed)
+                )
+                raise ValueError("Not allowed '%s' algorithm used", alg)
 
 
 def re_authenticate(request, authn):
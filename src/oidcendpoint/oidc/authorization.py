@@ -43,20 +43,7 @@ def host_component(url):
     return "{}://{}".format(res.scheme, res.netloc)
 
 
-ALG_PARAMS = {
-    "sign": [
-        "request_object_signing_alg",
-        "request_object_signing_alg_values_supported",
-    ],
-    "enc_alg": [
-        "request_object_encryption_alg",
-        "request_object_encryption_alg_values_supported",
-    ],
-    "enc_enc": [
-        "request_object_encryption_enc",
-        "request_object_encryption_enc_values_supported",
-    ],
-}
+ALG_PARAMS = authorization.ALG_PARAMS
 
 
 def re_authenticate(request, authn):
@@ -1,10 +1,25 @@
+from functools import lru_cache
+
 from oidcmsg import oidc
 from oidcmsg.oidc import JRD
-from oidcmsg.oidc import Link
 
 from oidcendpoint.endpoint import Endpoint
+from oidcendpoint.util import json_dumps
 
 OIC_ISSUER = "http://openid.net/specs/connect/1.0/issuer"
+# How long, in seconds, a WebFinger response may be cached by HTTP caches
+DISCOVERY_MAX_AGE = 3600
+
+
+@lru_cache(maxsize=256)
+def _discovery_response(subject, hrefs):
+    # The response always has this simple shape, so there is no need to
+    # go through the JRD message class to serialize it.
+    _response = {
+        "subject": subject,
+        "links": [{"href": h, "rel": OIC_ISSUER} for h in hrefs],
+    }
+    return json_dumps(_response).decode("utf-8")
 
 
 class Discovery(Endpoint):
@@ -24,13 +39,12 @@ class Discovery(Endpoint):
         :return: Response information
         """
 
-        links = [Link(href=h, rel=OIC_ISSUER) for h in kwargs["hrefs"]]
-
-        _response = JRD(subject=kwargs["subject"], links=links)
-
         info = {
-            "response": _response.to_json(),
-            "http_headers": [("Content-type", "application/json")],
+            "response": _discovery_response(kwargs["subject"], tuple(kwargs["hrefs"])),
+            "http_headers": [
+                ("Content-type", "application/json"),
+                ("Cache-Control", "max-age={}".format(DISCOVERY_MAX_AGE)),
+            ],
         }
 
         return info
@@ -1,13 +1,16 @@
-import json
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import parse_qs
+from urllib.parse import quote_plus
 from urllib.parse import urlencode
 from urllib.parse import urlparse
 
-from cryptojwt import as_unicode
+from cachetools import LRUCache
+from cachetools import cached
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptojwt import b64d
-from cryptojwt.jwe.aes import AES_GCMEncrypter
-from cryptojwt.jwe.utils import split_ctx_and_tag
 from cryptojwt.jws.exception import JWSException
 from cryptojwt.jws.jws import factory
 from cryptojwt.jws.utils import alg2keytype
@@ -21,16 +24,32 @@ from oidcmsg.oidc import verified_claim_name
 from oidcmsg.oidc.session import BACK_CHANNEL_LOGOUT_EVENT
 from oidcmsg.oidc.session import EndSessionRequest
 
-from oidcendpoint import rndstr
 from oidcendpoint.client_authn import UnknownOrNoAuthnMethod
 from oidcendpoint.cookie import append_cookie
 from oidcendpoint.endpoint import Endpoint
 from oidcendpoint.endpoint_context import add_path
 from oidcendpoint.oauth2.authorization import verify_uri
 from oidcendpoint.session import session_key
+from oidcendpoint.util import json_loads
 
 logger = logging.getLogger(__name__)
 
+# Length in bytes of the AES-GCM nonce used when encrypting sids
+SID_NONCE_LENGTH = 12
+
+# Max number of back-channel logout requests that are sent at the same time
+BACK_CHANNEL_LOGOUT_WORKERS = 8
+
+
+@cached(LRUCache(maxsize=1024), lock=threading.Lock())
+def _split_logout_uri(uri):
+    """
+    Split a front-channel logout URI into the URI without query and the
+    query arguments. The returned dictionary must not be modified.
+    """
+    p = urlparse(uri)
+    return p._replace(query="").geturl(), parse_qs(p.query)
+
 
 def do_front_channel_logout_iframe(cinfo, iss, sid):
     """
@@ -53,18 +72,13 @@ def do_front_channel_logout_iframe(cinfo, iss, sid):
     if flsr:
         _query = {"iss": iss, "sid": sid}
         if "?" in frontchannel_logout_uri:
-            p = urlparse(frontchannel_logout_uri)
-            _args = parse_qs(p.query)
-            _args.update(_query)
-            _query = _args
-            _np = p._replace(query="")
-            frontchannel_logout_uri = _np.geturl()
-
-        _iframe = '<iframe src="{}?{}">'.format(
-            frontchannel_logout_uri, urlencode(_query, doseq=True)
-        )
+            frontchannel_logout_uri, _args = _split_logout_uri(frontchannel_logout_uri)
+            _query = dict(_args, **_query)
+
+        _qs = urlencode(_query, doseq=True)
+        _iframe = f'<iframe src="{frontchannel_logout_uri}?{_qs}">'
     else:
-        _iframe = '<iframe src="{}">'.format(frontchannel_logout_uri)
+        _iframe = f'<iframe src="{frontchannel_logout_uri}">'
 
     return _iframe
 
@@ -90,18 +104,61 @@ class Session(Endpoint):
         if _csi and not _csi.startswith("http"):
             kwargs["check_session_iframe"] = add_path(endpoint_context.issuer, _csi)
         Endpoint.__init__(self, endpoint_context, **kwargs)
-        self.iv = as_bytes(rndstr(24))
 
-    def _encrypt_sid(self, sid):
-        encrypter = AES_GCMEncrypter(key=as_bytes(self.endpoint_context.symkey))
-        enc_msg = encrypter.encrypt(as_bytes(sid), iv=self.iv)
-        return as_unicode(b64e(enc_msg))
+        _path = self.kwargs.get("post_logout_uri_path")
+        if _path is None:
+            self._default_post_logout_uri = None
+        elif endpoint_context.issuer.endswith("/"):
+            self._default_post_logout_uri = f"{endpoint_context.issuer}{_path}"
+        else:
+            self._default_post_logout_uri = f"{endpoint_context.issuer}/{_path}"
 
-    def _decrypt_sid(self, enc_msg):
-        _msg = b64d(as_bytes(enc_msg))
-        encrypter = AES_GCMEncrypter(key=as_bytes(self.endpoint_context.symkey))
-        ctx, tag = split_ctx_and_tag(_msg)
-        return as_unicode(encrypter.decrypt(as_bytes(ctx), iv=self.iv, tag=as_bytes(tag)))
+        _verify_url = self.kwargs.get("logout_verify_url")
+        if _verify_url is None:
+            self._logout_verify_prefix = None
+        else:
+            _sep = "&" if "?" in _verify_url else "?"
+            self._logout_verify_prefix = f"{_verify_url}{_sep}sjwt="
+
+        self._signers = {}
+        # (symkey, AESGCM instance) tuple
+        self._encrypter = None
+
+    def _get_signer(self, alg, with_jti=False):
+        """
+        Return a JWT instance that signs with the given algorithm. Instances
+        are reused as long as the keyjar and issuer stay the same.
+
+        :param alg: Signing algorithm
+        :param with_jti: Whether a jti claim should be added
+        :return: A :py:class:`cryptojwt.jwt.JWT` instance
+        """
+        _cntx = self.endpoint_context
+        _jwt = self._signers.get((alg, with_jti))
+        if _jwt is None or _jwt.key_jar is not _cntx.keyjar or _jwt.iss != _cntx.issuer:
+            _jwt = JWT(_cntx.keyjar, iss=_cntx.issuer, lifetime=86400, sign_alg=alg)
+            _jwt.with_jti = with_jti
+            self._signers[(alg, with_jti)] = _jwt
+        return _jwt
+
+    def _get_encrypter(self):
+        _symkey = self.endpoint_context.symkey
+        if self._encrypter is None or self._encrypter[0] != _symkey:
+            self._encrypter = (_symkey, AESGCM(as_bytes(_symkey)))
+        return self._encrypter[1]
+
+    def _encrypt_sid(self, sid: str) -> str:
+        # A fresh nonce for every message, sent along in front of the cipher text
+        _nonce = os.urandom(SID_NONCE_LENGTH)
+        enc_msg = self._get_encrypter().encrypt(_nonce, sid.encode("utf-8"), None)
+        return b64e(_nonce + enc_msg).decode("ascii")
+
+    def _decrypt_sid(self, enc_msg) -> str:
+        if isinstance(enc_msg, str):
+            enc_msg = enc_msg.encode("ascii")
+        _msg = b64d(enc_msg)
+        _nonce, _ctx = _msg[:SID_NONCE_LENGTH], _msg[SID_NONCE_LENGTH:]
+        return self._get_encrypter().decrypt(_nonce, _ctx, None).decode("utf-8")
 
     def do_back_channel_logout(self, cinfo, sid):
         """
@@ -134,8 +191,7 @@ class Session(Endpoint):
         except KeyError:
             alg = _cntx.provider_info["id_token_signing_alg_values_supported"][0]
 
-        _jws = JWT(_cntx.keyjar, iss=_cntx.issuer, lifetime=86400, sign_alg=alg)
-        _jws.with_jti = True
+        _jws = self._get_signer(alg, with_jti=True)
         _logout_token = _jws.pack(payload=payload, recv=cinfo["client_id"])
 
         return back_channel_logout_uri, _logout_token
@@ -147,6 +203,7 @@ class Session(Endpoint):
 
     def logout_all_clients(self, sid):
         _mngr = self.endpoint_context.session_manager
+        # Fetching the client session info also verifies that it exists
         _session_info = _mngr.get_session_info(sid, user_session_info=True,
                                                client_session_info=True)
 
@@ -158,17 +215,23 @@ class Session(Endpoint):
         fc_iframes = {}
         _rel_sid = []
         for _client_id in _session_info["user_session_info"]["subordinate"]:
-            if "backchannel_logout_uri" in _cdb[_client_id]:
-                _sid = session_key(_user_id, _client_id)
-                _rel_sid.append(_sid)
-                _spec = self.do_back_channel_logout(_cdb[_client_id], _sid)
+            _cinfo = _cdb[_client_id]
+            if "backchannel_logout_uri" in _cinfo:
+                _back_channel = True
+            elif "frontchannel_logout_uri" in _cinfo:
+                _back_channel = False
+            else:
+                continue
+
+            _sid = session_key(_user_id, _client_id)
+            _rel_sid.append(_sid)
+            if _back_channel:
+                _spec = self.do_back_channel_logout(_cinfo, _sid)
                 if _spec:
                     bc_logouts[_client_id] = _spec
-            elif "frontchannel_logout_uri" in _cdb[_client_id]:
+            else:
                 # Construct an IFrame
-                _sid = session_key(_user_id, _client_id)
-                _rel_sid.append(_sid)
-                _spec = do_front_channel_logout_iframe(_cdb[_client_id], _iss, _sid)
+                _spec = do_front_channel_logout_iframe(_cinfo, _iss, _sid)
                 if _spec:
                     fc_iframes[_client_id] = _spec
 
@@ -196,20 +259,20 @@ class Session(Endpoint):
             raise ValueError("Not a signed JWT")
 
     def logout_from_client(self, sid):
-        _cdb = self.endpoint_context.cdb
         _session_information = self.endpoint_context.session_manager.get_session_info(
             sid, grant=True)
         _client_id = _session_information["client_id"]
+        _cinfo = self.endpoint_context.cdb[_client_id]
 
         res = {}
-        if "backchannel_logout_uri" in _cdb[_client_id]:
-            _spec = self.do_back_channel_logout(_cdb[_client_id], sid)
+        if "backchannel_logout_uri" in _cinfo:
+            _spec = self.do_back_channel_logout(_cinfo, sid)
             if _spec:
                 res["blu"] = {_client_id: _spec}
-        elif "frontchannel_logout_uri" in _cdb[_client_id]:
+        elif "frontchannel_logout_uri" in _cinfo:
             # Construct an IFrame
             _spec = do_front_channel_logout_iframe(
-                _cdb[_client_id], self.endpoint_context.issuer, sid
+                _cinfo, self.endpoint_context.issuer, sid
             )
             if _spec:
                 res["flu"] = {_client_id: _spec}
@@ -246,8 +309,8 @@ class Session(Endpoint):
 
         if part:
             # value is a base64 encoded JSON document
-            _cookie_info = json.loads(as_unicode(b64d(as_bytes(part[0]))))
-            logger.debug("Cookie info: {}".format(_cookie_info))
+            _cookie_info = json_loads(b64d(as_bytes(part[0])))
+            logger.debug("Cookie info: %s", _cookie_info)
             try:
                 _session_info = _mngr.get_session_info(_cookie_info["sid"],
                                                        grant=True)
@@ -259,9 +322,7 @@ class Session(Endpoint):
 
         if "id_token_hint" in request and _session_info:
             _id_token = request[verified_claim_name("id_token_hint")]
-            logger.debug(
-                "ID token hint: {}".format(_id_token)
-            )
+            logger.debug("ID token hint: %s", _id_token)
 
             _aud = _id_token["aud"]
             if _session_info["client_id"] not in _aud:
@@ -280,10 +341,9 @@ class Session(Endpoint):
         try:
             _uri = request["post_logout_redirect_uri"]
         except KeyError:
-            if _cntx.issuer.endswith("/"):
-                _uri = "{}{}".format(_cntx.issuer, self.kwargs["post_logout_uri_path"])
-            else:
-                _uri = "{}/{}".format(_cntx.issuer, self.kwargs["post_logout_uri_path"])
+            if self._default_post_logout_uri is None:
+                raise KeyError("post_logout_uri_path")
+            _uri = self._default_post_logout_uri
             plur = False
         else:
             plur = True
@@ -296,24 +356,20 @@ class Session(Endpoint):
 
         # redirect user to OP logout verification page
         if plur and "state" in request:
-            _uri = "{}?{}".format(_uri, urlencode({"state": request["state"]}))
+            _uri = f"{_uri}?state={quote_plus(request['state'])}"
             payload["state"] = request["state"]
 
         payload["redirect_uri"] = _uri
 
-        logger.debug("JWS payload: {}".format(payload))
+        logger.debug("JWS payload: %s", payload)
         # From me to me
-        _jws = JWT(
-            _cntx.keyjar,
-            iss=_cntx.issuer,
-            lifetime=86400,
-            sign_alg=self.kwargs["signing_alg"],
-        )
+        _jws = self._get_signer(self.kwargs["signing_alg"])
         sjwt = _jws.pack(payload=payload, recv=_cntx.issuer)
 
-        location = "{}?{}".format(
-            self.kwargs["logout_verify_url"], urlencode({"sjwt": sjwt})
-        )
+        if self._logout_verify_prefix is None:
+            raise KeyError("logout_verify_url")
+        # A compact JWS only contains URL safe characters
+        location = self._logout_verify_prefix + sjwt
         return {"redirect_location": location}
 
     def parse_request(self, request, auth=None, **kwargs):
@@ -362,6 +418,29 @@ class Session(Endpoint):
 
         return request
 
+    def _back_channel_logout(self, client_id, spec):
+        """
+        Post a logout token to a client's back-channel logout URI.
+
+        :param client_id: Client ID
+        :param spec: Tuple with logout URI and signed logout token
+        """
+        _url, sjwt = spec
+        logger.info("logging out from %s at %s", client_id, _url)
+
+        res = self.endpoint_context.httpc.post(
+            _url,
+            data=f"logout_token={sjwt}",
+            **self.endpoint_context.httpc_params
+        )
+
+        if res.status_code < 300:
+            logger.info("Logged out from %s", client_id)
+        elif res.status_code in [501, 504]:
+            logger.info("Got a %s which is acceptable", res.status_code)
+        elif res.status_code >= 400:
+            logger.info("failed to logout from %s", client_id)
+
     def do_verified_logout(self, sid, alla=False, **kwargs):
         if alla:
             _res = self.logout_all_clients(sid=sid)
@@ -369,24 +448,16 @@ class Session(Endpoint):
             _res = self.logout_from_client(sid=sid)
 
         bcl = _res.get("blu")
-        if bcl:
-            # take care of Back channel logout first
-            for _cid, spec in bcl.items():
-                _url, sjwt = spec
-                logger.info("logging out from {} at {}".format(_cid, _url))
-
-                res = self.endpoint_context.httpc.post(
-                    _url,
-                    data="logout_token={}".format(sjwt),
-                    **self.endpoint_context.httpc_params
-                )
-
-                if res.status_code < 300:
-                    logger.info("Logged out from {}".format(_cid))
-                elif res.status_code in [501, 504]:
-                    logger.info("Got a %s which is acceptable", res.status_code)
-                elif res.status_code >= 400:
-                    logger.info("failed to logout from {}".format(_cid))
+        # take care of Back channel logout first.
+        if bcl and (len(bcl) == 1 or not self.endpoint_context.httpc_is_thread_safe()):
+            for _cid, _spec in bcl.items():
+                self._back_channel_logout(_cid, _spec)
+        elif bcl:
+            # More than one client, contact them in parallel.
+            _workers = min(len(bcl), BACK_CHANNEL_LOGOUT_WORKERS)
+            with ThreadPoolExecutor(max_workers=_workers) as _pool:
+                # Consume the results so exceptions are raised here
+                list(_pool.map(self._back_channel_logout, bcl.keys(), bcl.values()))
 
         return _res["flu"].values() if _res.get("flu") else []
 
@@ -28,6 +28,7 @@ SCOPE2CLAIMS = {
 def available_scopes(endpoint_context):
     _supported = endpoint_context.provider_info.get("scopes_supported")
     if _supported:
+        _supported = set(_supported)
         return [s for s in endpoint_context.scope2claims.keys() if s in _supported]
     else:
         return [s for s in endpoint_context.scope2claims.keys()]
@@ -43,6 +44,8 @@ def convert_scopes2claims(scopes, allowed_claims=None, map=None):
             claims = {name: None for name in map[scope]}
             res.update(claims)
     else:
+        if not isinstance(allowed_claims, (set, frozenset)):
+            allowed_claims = frozenset(allowed_claims)
         for scope in scopes:
             try:
                 claims = {name: None for name in map[scope] if name in allowed_claims}
@@ -11,9 +11,18 @@ logger = logging.getLogger(__name__)
 
 # USAGE = Literal["userinfo", "id_token", "introspection"]
 
-IGNORE = ["error", "error_description", "error_uri", "_claim_names", "_claim_sources"]
+IGNORE = frozenset(
+    ["error", "error_description", "error_uri", "_claim_names", "_claim_sources"])
 STANDARD_CLAIMS = [c for c in OpenIDSchema.c_param.keys() if c not in IGNORE]
 
+# Usages an authorization request can ask for specific claims for
+REQUEST_CLAIMS_USAGE = frozenset(["id_token", "userinfo"])
+ALL_USAGE = ("userinfo", "introspection", "id_token", "token")
+# Client metadata parameter holding the client's claims per usage
+CLIENT_CLAIMS_KEY = {
+    usage: "{}_claims".format(usage) for usage in ALL_USAGE + ("access_token",)
+}
+
 
 def available_claims(endpoint_context):
     _supported = endpoint_context.provider_info.get("claims_supported")
@@ -33,7 +42,7 @@ class ClaimsInterface:
         self.endpoint_context = endpoint_context
 
     def authorization_request_claims(self, session_id: str, usage: Optional[str] = "") -> dict:
-        if usage in ["id_token", "userinfo"]:
+        if usage in REQUEST_CLAIMS_USAGE:
             _grant = self.endpoint_context.session_manager.get_grant(session_id)
             if "claims" in _grant.authorization_request:
                 return _grant.authorization_request["claims"].get(usage, {})
@@ -42,67 +51,51 @@ class ClaimsInterface:
 
     def _get_client_claims(self, client_id, usage):
         client_info = self.endpoint_context.cdb.get(client_id, {})
-        client_claims = client_info.get("{}_claims".format(usage), {})
+        _key = CLIENT_CLAIMS_KEY.get(usage) or "{}_claims".format(usage)
+        client_claims = client_info.get(_key, {})
         if isinstance(client_claims, list):
-            client_claims = {k: None for k in client_claims}
+            client_claims = dict.fromkeys(client_claims)
         return client_claims
 
-    def get_claims(self, session_id: str, scopes: str, usage: str) -> dict:
-        """
-
-        :param session_id: Session identifier
-        :param scopes: Scopes
-        :param usage: Where to use the claims. One of "userinfo"/"id_token"/"introspection"
-        :return: Claims specification as a dictionary.
-        """
+    def _claims_by_scope(self, client_id, scopes):
+        _context = self.endpoint_context
+        _scopes = _context.scopes_handler.filter_scopes(client_id, _context, scopes)
+        return convert_scopes2claims(_scopes, map=_context.scope2claims)
 
+    def _get_module(self, usage):
         # which endpoint module configuration to get the base claims from
-        module = None
+        _context = self.endpoint_context
         if usage == "userinfo":
-            if "userinfo" in self.endpoint_context.endpoint:
-                module = self.endpoint_context.endpoint["userinfo"]
+            return _context.endpoint.get("userinfo")
         elif usage == "id_token":
-            if self.endpoint_context.idtoken:
-                module = self.endpoint_context.idtoken
+            return _context.idtoken or None
         elif usage == "introspection":
-            if "introspection" in self.endpoint_context.endpoint:
-                module = self.endpoint_context.endpoint["introspection"]
+            return _context.endpoint.get("introspection")
         elif usage == "access_token":
-            try:
-                module = self.endpoint_context.session_manager.token_handler["access_token"]
-            except KeyError:
-                pass
+            return _context.session_manager.token_handler.handler.get("access_token")
+        return None
 
-        if module:
-            base_claims = module.kwargs.get("base_claims", {})
-        else:
-            base_claims = {}
-
-        user_id, client_id, grant_id = unpack_session_key(session_id)
+    def _get_claims(self, client_id: str, scopes: str, usage: str,
+                    request_claims: dict) -> dict:
+        module = self._get_module(usage)
+        if not module:
+            return dict(request_claims)
 
+        _kwargs = module.kwargs
         # Can there be per client specification of which claims to use.
-        if module and module.kwargs.get("enable_claims_per_client"):
-            claims = self._get_client_claims(client_id, usage)
+        if _kwargs.get("enable_claims_per_client"):
+            claims = dict(self._get_client_claims(client_id, usage))
         else:
             claims = {}
 
-        claims.update(base_claims)
+        _base_claims = _kwargs.get("base_claims")
+        if _base_claims:
+            claims.update(_base_claims)
 
         # Scopes can in some cases equate to set of claims, is that used here ?
-        if module and module.kwargs.get("add_claims_by_scope"):
+        if _kwargs.get("add_claims_by_scope"):
             if scopes:
-                _scopes = self.endpoint_context.scopes_handler.filter_scopes(
-                    client_id, self.endpoint_context, scopes
-                )
-
-                _claims = convert_scopes2claims(
-                    _scopes, map=self.endpoint_context.scope2claims
-                )
-                claims.update(_claims)
-
-        # Bring in claims specification from the authorization request
-        request_claims = self.authorization_request_claims(session_id=session_id,
-                                                           usage=usage)
+                claims.update(self._claims_by_scope(client_id, scopes))
 
         # This will add claims that has not be added before and
         # set filters on those claims that also appears in one of the sources above
@@ -111,10 +104,35 @@ class ClaimsInterface:
 
         return claims
 
+    def get_claims(self, session_id: str, scopes: str, usage: str) -> dict:
+        """
+
+        :param session_id: Session identifier
+        :param scopes: Scopes
+        :param usage: Where to use the claims. One of "userinfo"/"id_token"/"introspection"
+        :return: Claims specification as a dictionary.
+        """
+        user_id, client_id, grant_id = unpack_session_key(session_id)
+
+        # Bring in claims specification from the authorization request
+        request_claims = self.authorization_request_claims(session_id=session_id,
+                                                           usage=usage)
+
+        return self._get_claims(client_id, scopes, usage, request_claims)
+
     def get_claims_all_usage(self, session_id: str, scopes: str) -> dict:
+        user_id, client_id, grant_id = unpack_session_key(session_id)
+
+        _grant = self.endpoint_context.session_manager.get_grant(session_id)
+        _request_claims = _grant.authorization_request.get("claims", {})
+
         _claims = {}
-        for usage in ["userinfo", "introspection", "id_token", "token"]:
-            _claims.update(self.get_claims(session_id, scopes, usage))
+        for usage in ALL_USAGE:
+            if usage in REQUEST_CLAIMS_USAGE:
+                request_claims = _request_claims.get(usage, {})
+            else:
+                request_claims = {}
+            _claims.update(self._get_claims(client_id, scopes, usage, request_claims))
         return _claims
 
     def get_user_claims(self, user_id: str, claims_restriction: dict) -> dict:
@@ -128,8 +146,12 @@ class ClaimsInterface:
             # Get all possible claims
             user_info = self.endpoint_context.userinfo(user_id, client_id=None)
             # Filter out the once that can be returned
-            return {k: user_info.get(k) for k, v in claims_restriction.items() if
-                    claims_match(user_info.get(k), v)}
+            res = {}
+            for key, spec in claims_restriction.items():
+                _val = user_info.get(key)
+                if claims_match(_val, spec):
+                    res[key] = _val
+            return res
         else:
             return {}
 
@@ -152,26 +174,15 @@ def claims_match(value: Union[str, int], claimspec: Optional[dict]) -> bool:
     if claimspec is None:  # match anything
         return True
 
-    matched = False
-    for key, val in claimspec.items():
-        if key == "value":
-            if value == val:
-                matched = True
-        elif key == "values":
-            if value in val:
-                matched = True
-        elif key == "essential":
-            # Whether it's essential or not doesn't change anything here
-            continue
-
-        if matched:
-            break
+    if "value" in claimspec and value == claimspec["value"]:
+        return True
 
-    if matched is False:
-        if list(claimspec.keys()) == ["essential"]:
-            return True
+    _values = claimspec.get("values")
+    if _values is not None and value in _values:
+        return True
 
-    return matched
+    # Whether it's essential or not doesn't change anything here
+    return len(claimspec) == 1 and "essential" in claimspec
 
 
 def by_schema(cls, **kwa):
@@ -182,4 +193,4 @@ def by_schema(cls, **kwa):
     :param kwa: Keyword arguments
     :return: A dictionary with claims (keys) that meets the filter criteria
     """
-    return dict([(key, val) for key, val in kwa.items() if key in cls.c_param])
+    return {key: val for key, val in kwa.items() if key in cls.c_param}
@@ -3,6 +3,7 @@ import logging
 import uuid
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 from oidcmsg.oauth2 import AuthorizationRequest
 
@@ -82,6 +83,18 @@ class SessionManager(Database):
 
         return None
 
+    def get_grant_and_token(self, session_id: str,
+                            token_value: str) -> Tuple[Grant, Optional[Token]]:
+        """
+        Return the grant and the token with the given value issued within it.
+
+        :param session_id: Based on 3-tuple, user_id, client_id and grant_id
+        :param token_value:
+        :return: 2-tuple, the Grant instance and a Token instance or None
+        """
+        grant = self.get(unpack_session_key(session_id))
+        return grant, grant.get_token(token_value)
+
     def create_grant(self,
                      authn_event: AuthnEvent,
                      auth_req: AuthorizationRequest,
@@ -233,13 +246,12 @@ class SessionManager(Database):
         :param recursive: Revoke all tokens that was minted using this token or
             tokens minted by this token. Recursively.
         """
-        token = self.find_token(session_id, token_value)
+        grant, token = self.get_grant_and_token(session_id, token_value)
         if token is None:
             raise UnknownToken()
 
         token.revoked = True
         if recursive:
-            grant = self[session_id]
             self._revoke_dependent(grant, token)
 
     def get_authentication_events(self, session_id: Optional[str] = "",
@@ -1,8 +1,10 @@
 import base64
 import hashlib
 import logging
+import threading
 from typing import Optional
 
+from cachetools import LRUCache
 from cryptography.fernet import Fernet
 from cryptojwt.utils import as_bytes
 from cryptojwt.utils import as_unicode
@@ -101,6 +103,9 @@ class DefaultToken(Token):
         Token.__init__(self, typ, **kwargs)
         self.crypt = Crypt(password)
         self.token_type = token_type
+        # Decrypted tokens, a token's content never changes
+        self._split = LRUCache(maxsize=1024)
+        self._lock = threading.Lock()
 
     def __call__(self,
                  session_id: Optional[str] = '',
@@ -144,12 +149,20 @@ class DefaultToken(Token):
         return csum.hexdigest()  # 56 bytes long, 224 bits
 
     def split_token(self, token):
+        with self._lock:
+            _parts = self._split.get(token)
+        if _parts is not None:
+            return list(_parts)
+
         try:
             plain = self.crypt.decrypt(base64.b64decode(token))
         except Exception:
             raise UnknownToken(token)
         # order: rnd, type, sid
-        return lv_unpack(plain)
+        _parts = lv_unpack(plain)
+        with self._lock:
+            self._split[token] = tuple(_parts)
+        return _parts
 
     def info(self, token: str) -> dict:
         """
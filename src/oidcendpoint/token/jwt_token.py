@@ -1,6 +1,7 @@
 from typing import Optional
 
 from cryptojwt import JWT
+from cryptojwt.exception import Invalid
 from cryptojwt.jws.exception import JWSException
 
 from oidcendpoint.exception import ToOld
@@ -42,6 +43,16 @@ class JWTToken(Token):
         self.def_aud = aud or []
         self.alg = alg
 
+        # JWT keeps no per call state so one signer and one verifier
+        # can be reused for every token.
+        self._signer = JWT(
+            key_jar=self.key_jar,
+            iss=self.issuer,
+            lifetime=self.lifetime,
+            sign_alg=self.alg,
+        )
+        self._verifier = JWT(key_jar=self.key_jar, allowed_sign_algs=[self.alg])
+
     def __call__(self,
                  session_id: Optional[str] = '',
                  ttype: Optional[str] = '',
@@ -63,14 +74,7 @@ class JWTToken(Token):
         payload.update({"sid": session_id, "ttype": ttype})
 
         # payload.update(kwargs)
-        signer = JWT(
-            key_jar=self.key_jar,
-            iss=self.issuer,
-            lifetime=self.lifetime,
-            sign_alg=self.alg,
-        )
-
-        return signer.pack(payload)
+        return self._signer.pack(payload)
 
     def info(self, token):
         """
@@ -80,10 +84,9 @@ class JWTToken(Token):
         :param token: A token
         :return: tuple of token type and session id
         """
-        verifier = JWT(key_jar=self.key_jar, allowed_sign_algs=[self.alg])
         try:
-            _payload = verifier.unpack(token)
-        except JWSException:
+            _payload = self._verifier.unpack(token)
+        except (Invalid, JWSException):
             raise UnknownToken()
 
         if is_expired(_payload["exp"]):
@@ -106,8 +109,10 @@ class JWTToken(Token):
             0 means now.
         :return: True/False
         """
-        verifier = JWT(key_jar=self.key_jar, allowed_sign_algs=[self.alg])
-        _payload = verifier.unpack(token)
+        try:
+            _payload = self._verifier.unpack(token)
+        except (Invalid, JWSException):
+            raise UnknownToken()
         return is_expired(_payload["exp"], when)
 
     def gather_args(self, sid, sdb, udb):
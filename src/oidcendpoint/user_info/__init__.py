@@ -34,7 +34,8 @@ class UserInfo(object):
         if db is not None:
             self.db = db
         elif db_file:
-            self.db = json.loads(open(db_file).read())
+            with open(db_file) as fp:
+                self.db = json.load(fp)
         else:
             self.db = {}
 
@@ -8,11 +8,40 @@ from urllib.parse import urlunsplit
 
 from oidcendpoint.exception import OidcEndpointError
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logger = logging.getLogger(__name__)
 
 OAUTH2_NOCACHE_HEADERS = [("Pragma", "no-cache"), ("Cache-Control", "no-store")]
 
 
+def json_loads(doc):
+    """
+    Parse a JSON document. Uses orjson if it is installed.
+
+    :param doc: The JSON document as bytes or str
+    :return: The deserialized document
+    """
+    if orjson:
+        return orjson.loads(doc)
+    return json.loads(doc)
+
+
+def json_dumps(obj):
+    """
+    Serialize an object to JSON. Uses orjson if it is installed.
+
+    :param obj: The object to serialize
+    :return: The JSON document as bytes
+    """
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
 def modsplit(s):
     """Split importable"""
     if ":" in s:
@@ -155,6 +184,10 @@ def get_http_params(config):
         else:
             params["cert"] = _cert
 
+    _timeout = config.get("timeout")
+    if _timeout:
+        params["timeout"] = _timeout
+
     return params
 
 
@@ -2,10 +2,12 @@ import io
 from copy import copy
 
 import pytest
+import responses
 import yaml
 from cryptojwt.key_jar import build_keyjar
 
 from oidcendpoint.endpoint_context import EndpointContext
+from oidcendpoint.endpoint_context import http_session
 from oidcendpoint.id_token import IDToken
 from oidcendpoint.oidc.add_on.pkce import add_pkce_support
 from oidcendpoint.oidc.authorization import Authorization
@@ -147,3 +149,16 @@ def test_cdb():
     endpoint_context.cdb = _clients["oidc_clients"]
 
     assert set(endpoint_context.cdb.keys()) == {"client1", "client2", "client3"}
+
+
+def test_http_session_keeps_no_cookies():
+    _session = http_session()
+    with responses.RequestsMock() as rsps:
+        rsps.add(responses.GET, "https://rp.example.com/sector", body="[]",
+                 headers={"Set-Cookie": "sid=abc; Path=/"})
+        rsps.add(responses.POST, "https://rp2.example.com/logout", body="")
+        _session.get("https://rp.example.com/sector")
+        _resp = _session.post("https://rp2.example.com/logout")
+
+    assert len(_session.cookies) == 0
+    assert "Cookie" not in _resp.request.headers
@@ -4,6 +4,9 @@ from oidcendpoint.oidc.registration import Registration
 from oidcendpoint.oidc.token import Token
 from oidcendpoint.oidc.userinfo import UserInfo
 from oidcendpoint.user_authn.authn_context import INTERNETPROTOCOLPASSWORD
+from oidcendpoint.util import get_http_params
+from oidcendpoint.util import json_dumps
+from oidcendpoint.util import json_loads
 
 KEYDEFS = [
     {"type": "RSA", "key": "", "use": ["sig"]},
@@ -56,3 +59,19 @@ conf = {
     },
     "template_dir": "template",
 }
+
+
+def test_json_loads():
+    assert json_loads(b'{"uid": "diana", "sid": "abc"}') == {"uid": "diana", "sid": "abc"}
+    assert json_loads('{"uid": "diana"}') == {"uid": "diana"}
+
+
+def test_json_dumps():
+    _doc = json_dumps({"authn_time": 1600000000})
+    assert isinstance(_doc, bytes)
+    assert json_loads(_doc) == {"authn_time": 1600000000}
+
+
+def test_get_http_params():
+    assert get_http_params({"verify": False}) == {"verify": False}
+    assert get_http_params({"verify": True, "timeout": 5}) == {"verify": True, "timeout": 5}
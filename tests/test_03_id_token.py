@@ -32,7 +32,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERS = json.loads(open(full_path("users.json")).read())
+with open(full_path("users.json")) as fp:
+    USERS = json.load(fp)
 USERINFO = UserInfo(USERS)
 
 AREQ = AuthorizationRequest(
@@ -8,6 +8,7 @@ import pytest
 
 from oidcendpoint.token import Crypt
 from oidcendpoint.token import is_expired
+from oidcendpoint.token.exception import UnknownToken
 from oidcendpoint.token.handler import DefaultToken
 from oidcendpoint.token.handler import TokenHandler
 from oidcendpoint.token.handler import factory
@@ -76,6 +77,16 @@ class TestDefaultToken(object):
         assert p[1] == "A"
         assert p[2] == "session_id"
 
+    def test_default_token_split_token_cached(self):
+        _token = self.th("session_id")
+        p = self.th.split_token(_token)
+        p[2] = "changed"
+        assert self.th.split_token(_token)[2] == "session_id"
+        assert self.th.info(_token)["sid"] == "session_id"
+
+        with pytest.raises(UnknownToken):
+            self.th.split_token("not a token")
+
     def test_default_token_info(self):
         _token = self.th("another_id")
         _info = self.th.info(_token)
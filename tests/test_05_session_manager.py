@@ -262,6 +262,27 @@ class TestSessionManager:
         assert _token.type == "access_token"
         assert _token.id == access_token.id
 
+    def test_get_grant_and_token(self):
+        self.session_manager.create_session(authn_event=self.authn_event,
+                                            auth_req=AUTH_REQ,
+                                            user_id='diana',
+                                            client_id="client_1")
+
+        grant = self.session_manager.add_grant(user_id="diana",
+                                               client_id="client_1")
+
+        code = self._mint_token('authorization_code', grant, DUMMY_SESSION_ID)
+
+        _session_key = session_key('diana', 'client_1', grant.id)
+        _grant, _token = self.session_manager.get_grant_and_token(_session_key, code.value)
+
+        assert _grant is grant
+        assert _token is code
+
+        _grant, _token = self.session_manager.get_grant_and_token(_session_key, "unknown")
+        assert _grant is grant
+        assert _token is None
+
     def test_get_authentication_event(self):
         session_id = self.session_manager.create_session(authn_event=self.authn_event,
                                                          auth_req=AUTH_REQ,
@@ -78,7 +78,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO_db = json.loads(open(full_path("users.json")).read())
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
 
 
 class TestAuthnBroker:
@@ -1,8 +1,11 @@
 import json
 import os
+from types import MappingProxyType
 
 import pytest
+from cryptojwt.key_jar import init_key_jar
 from oidcmsg.oidc import OpenIDRequest
+from oidcmsg.oidc import OpenIDSchema
 
 from oidcendpoint.authn_event import create_authn_event
 from oidcendpoint.endpoint_context import EndpointContext
@@ -14,9 +17,10 @@ from oidcendpoint.oidc.registration import Registration
 from oidcendpoint.scopes import SCOPE2CLAIMS
 from oidcendpoint.scopes import convert_scopes2claims
 from oidcendpoint.session import session_key
-from oidcendpoint.session import unpack_session_key
 from oidcendpoint.session.claims import STANDARD_CLAIMS
 from oidcendpoint.session.claims import ClaimsInterface
+from oidcendpoint.session.claims import by_schema
+from oidcendpoint.session.claims import claims_match
 from oidcendpoint.session.grant import Grant
 from oidcendpoint.user_authn.authn_context import INTERNETPROTOCOLPASSWORD
 from oidcendpoint.user_info import UserInfo
@@ -54,6 +58,23 @@ OIDR = OpenIDRequest(
     claims=CLAIMS,
 )
 
+OIDR_CLAIMS_2 = OpenIDRequest(
+    response_type="code",
+    client_id="client1",
+    redirect_uri="http://example.com/authz",
+    scope=["openid"],
+    state="state000",
+    claims=CLAIMS_2,
+)
+
+OIDR_EMAIL_ADDRESS = OpenIDRequest(
+    response_type="code",
+    client_id="client1",
+    redirect_uri="http://example.com/authz",
+    scope="openid email address",
+    state="state000",
+)
+
 RESPONSE_TYPES_SUPPORTED = [
     ["code"],
     ["token"],
@@ -64,6 +85,7 @@ RESPONSE_TYPES_SUPPORTED = [
     ["code", "token", "id_token"],
     ["none"],
 ]
+RESPONSE_TYPES_SUPPORTED_STR = [" ".join(x) for x in RESPONSE_TYPES_SUPPORTED]
 
 BASEDIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -72,12 +94,30 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO_DB = json.loads(open(full_path("users.json")).read())
+# Shared by all the tests, read only so that no test can change it for the others
+with open(full_path("users.json")) as fp:
+    USERINFO_DB = MappingProxyType(json.load(fp))
+
+# Claims returned for diana by more than one test
+CLAIMS_2_USERINFO = MappingProxyType({
+    "eduperson_scoped_affiliation": ["staff@example.org"],
+    "nickname": "Dina",
+    "email": "diana@example.org",
+    "email_verified": False,
+})
+EMAIL_USERINFO = MappingProxyType({
+    "email": "diana@example.org",
+    "email_verified": False,
+})
+
+EMAIL_CLAIMS = frozenset(["email", "email_verified"])
+ADDRESS_CLAIMS = frozenset(["address"])
+PHONE_CLAIMS = frozenset(["phone_number", "phone_number_verified"])
 
 
 def test_default_scope2claims():
     assert convert_scopes2claims(["openid"], STANDARD_CLAIMS) == {"sub": None}
-    assert set(convert_scopes2claims(["profile"], STANDARD_CLAIMS).keys()) == {
+    assert convert_scopes2claims(["profile"], STANDARD_CLAIMS).keys() == {
         "name",
         "given_name",
         "family_name",
@@ -93,17 +133,9 @@ def test_default_scope2claims():
         "updated_at",
         "preferred_username",
     }
-    assert set(convert_scopes2claims(["email"], STANDARD_CLAIMS).keys()) == {
-        "email",
-        "email_verified",
-    }
-    assert set(convert_scopes2claims(["address"], STANDARD_CLAIMS).keys()) == {
-        "address"
-    }
-    assert set(convert_scopes2claims(["phone"], STANDARD_CLAIMS).keys()) == {
-        "phone_number",
-        "phone_number_verified",
-    }
+    assert convert_scopes2claims(["email"], STANDARD_CLAIMS).keys() == EMAIL_CLAIMS
+    assert convert_scopes2claims(["address"], STANDARD_CLAIMS).keys() == ADDRESS_CLAIMS
+    assert convert_scopes2claims(["phone"], STANDARD_CLAIMS).keys() == PHONE_CLAIMS
     assert convert_scopes2claims(["offline_access"], STANDARD_CLAIMS) == {}
 
     assert convert_scopes2claims(["openid", "email", "phone"], STANDARD_CLAIMS) == {
@@ -134,29 +166,41 @@ def test_custom_scopes():
     _available_claims = STANDARD_CLAIMS[:]
     _available_claims.append("eduperson_scoped_affiliation")
 
-    assert set(
-        convert_scopes2claims(["email"], _available_claims, map=_scopes).keys()
-    ) == {"email", "email_verified", }
-    assert set(
-        convert_scopes2claims(["address"], _available_claims, map=_scopes).keys()
-    ) == {"address"}
-    assert set(
-        convert_scopes2claims(["phone"], _available_claims, map=_scopes).keys()
-    ) == {"phone_number", "phone_number_verified", }
-
-    assert set(
-        convert_scopes2claims(
-            ["research_and_scholarship"], _available_claims, map=_scopes
-        ).keys()
-    ) == {
-               "name",
-               "given_name",
-               "family_name",
-               "email",
-               "email_verified",
-               "sub",
-               "eduperson_scoped_affiliation",
-           }
+    assert convert_scopes2claims(
+        ["email"], _available_claims, map=_scopes).keys() == EMAIL_CLAIMS
+    assert convert_scopes2claims(
+        ["address"], _available_claims, map=_scopes).keys() == ADDRESS_CLAIMS
+    assert convert_scopes2claims(
+        ["phone"], _available_claims, map=_scopes).keys() == PHONE_CLAIMS
+
+    assert convert_scopes2claims(
+        ["research_and_scholarship"], _available_claims, map=_scopes
+    ).keys() == {
+        "name",
+        "given_name",
+        "family_name",
+        "email",
+        "email_verified",
+        "sub",
+        "eduperson_scoped_affiliation",
+    }
+
+
+def test_claims_match():
+    assert claims_match(None, None) is False
+    assert claims_match("foo", None)
+    assert claims_match("foo", {"essential": True})
+    assert claims_match("foo", {"value": "foo"})
+    assert claims_match("foo", {"value": "bar"}) is False
+    assert claims_match("foo", {"values": ["bar", "foo"]})
+    assert claims_match("foo", {"values": ["bar"], "essential": True}) is False
+    assert claims_match("foo", {"value": "bar", "values": ["foo"]})
+    assert claims_match("foo", {}) is False
+
+
+def test_by_schema():
+    res = by_schema(OpenIDSchema, sub="diana", email="diana@example.org", foo="bar")
+    assert res == {"sub": "diana", "email": "diana@example.org"}
 
 
 PROVIDER_INFO = {
@@ -177,6 +221,12 @@ KEYDEFS = [
     {"type": "EC", "crv": "P-256", "use": ["sig"]},
 ]
 
+ISSUER = "https://example.com/op"
+# Generated once for all the endpoint contexts built in this module
+KEYJAR = init_key_jar(key_defs=KEYDEFS, issuer_id=ISSUER)
+for _kb in KEYJAR[ISSUER].get_bundles():
+    KEYJAR.add_kb("", _kb)
+
 
 class TestCollectUserInfo:
     @pytest.fixture(autouse=True)
@@ -204,9 +254,7 @@ class TestCollectUserInfo:
                         "path": "{}/authorization",
                         "class": Authorization,
                         "kwargs": {
-                            "response_types_supported": [
-                                " ".join(x) for x in RESPONSE_TYPES_SUPPORTED
-                            ],
+                            "response_types_supported": RESPONSE_TYPES_SUPPORTED_STR,
                             "response_modes_supported": [
                                 "query",
                                 "fragment",
@@ -259,7 +307,8 @@ class TestCollectUserInfo:
                         "enable_claims_per_client": True
                     },
                 },
-            }
+            },
+            keyjar=KEYJAR,
         )
         # Just has to be there
         self.endpoint_context.cdb["client1"] = {}
@@ -280,8 +329,7 @@ class TestCollectUserInfo:
                                                    sub_type=sub_type)
 
     def test_collect_user_info(self):
-        _req = OIDR.copy()
-        _req["claims"] = CLAIMS_2
+        _req = OIDR_CLAIMS_2
 
         session_id = self._create_session(_req)
 
@@ -291,12 +339,7 @@ class TestCollectUserInfo:
 
         res = self.claims_interface.get_user_claims("diana", _userinfo_restriction)
 
-        assert res == {
-            'eduperson_scoped_affiliation': ['staff@example.org'],
-            "email": "diana@example.org",
-            "nickname": "Dina",
-            "email_verified": False
-        }
+        assert res == CLAIMS_2_USERINFO
 
         _id_token_restriction = self.claims_interface.get_claims(session_id=session_id,
                                                                  scopes=OIDR["scope"],
@@ -304,10 +347,7 @@ class TestCollectUserInfo:
 
         res = self.claims_interface.get_user_claims("diana", _id_token_restriction)
 
-        assert res == {
-            "email": "diana@example.org",
-            "email_verified": False,
-        }
+        assert res == EMAIL_USERINFO
 
         _introspection_restriction = self.claims_interface.get_claims(session_id=session_id,
                                                                       scopes=OIDR["scope"],
@@ -317,13 +357,25 @@ class TestCollectUserInfo:
 
         assert res == {}
 
+    def test_get_claims_all_usage(self):
+        _req = OIDR_CLAIMS_2
+
+        session_id = self._create_session(_req)
+
+        _expected = {}
+        for usage in ["userinfo", "introspection", "id_token"]:
+            _expected.update(self.claims_interface.get_claims(session_id=session_id,
+                                                              scopes=OIDR["scope"],
+                                                              usage=usage))
+
+        res = self.claims_interface.get_claims_all_usage(session_id, OIDR["scope"])
+        assert res == _expected
+        assert "nickname" in res
+
     def test_collect_user_info_2(self):
-        _req = OIDR.copy()
-        _req["scope"] = "openid email address"
-        del _req["claims"]
+        _req = OIDR_EMAIL_ADDRESS
 
         session_id = self._create_session(_req)
-        _uid, _cid, _gid = unpack_session_key(session_id)
 
         _userinfo_restriction = self.claims_interface.get_claims(session_id=session_id,
                                                                  scopes=_req["scope"],
@@ -344,12 +396,9 @@ class TestCollectUserInfo:
         }
 
     def test_collect_user_info_scope_not_supported_no_base_claims(self):
-        _req = OIDR.copy()
-        _req["scope"] = "openid email address"
-        del _req["claims"]
+        _req = OIDR_EMAIL_ADDRESS
 
         session_id = self._create_session(_req)
-        _uid, _cid, _gid = unpack_session_key(session_id)
 
         self.endpoint_context.endpoint["userinfo"].kwargs["add_claims_by_scope"] = False
         self.endpoint_context.endpoint["userinfo"].kwargs["enable_claims_per_client"] = False
@@ -364,12 +413,9 @@ class TestCollectUserInfo:
         assert res == {}
 
     def test_collect_user_info_enable_claims_per_client(self):
-        _req = OIDR.copy()
-        _req["scope"] = "openid email address"
-        del _req["claims"]
+        _req = OIDR_EMAIL_ADDRESS
 
         session_id = self._create_session(_req)
-        _uid, _cid, _gid = unpack_session_key(session_id)
 
         self.endpoint_context.endpoint["userinfo"].kwargs["add_claims_by_scope"] = False
         self.endpoint_context.endpoint["userinfo"].kwargs["enable_claims_per_client"] = True
@@ -385,6 +431,47 @@ class TestCollectUserInfo:
 
         assert res == {'phone_number': '+46907865000'}
 
+    def test_get_claims_client_update(self):
+        _req = OIDR.copy()
+        _req["scope"] = ["openid", "address"]
+        del _req["claims"]
+
+        session_id = self._create_session(_req)
+        self.endpoint_context.cdb["client1"] = {"userinfo_claims": {"phone_number": None}}
+
+        _restriction = self.claims_interface.get_claims(session_id=session_id,
+                                                        scopes=_req["scope"],
+                                                        usage="userinfo")
+        assert "address" in _restriction
+        assert "phone_number" in _restriction
+        # The client's own specification is left untouched
+        assert self.endpoint_context.cdb["client1"]["userinfo_claims"] == {
+            "phone_number": None}
+
+        # A re-registered client gets its new allowed scopes applied
+        self.endpoint_context.cdb["client1"] = {"allowed_scopes": ["openid"]}
+        _restriction = self.claims_interface.get_claims(session_id=session_id,
+                                                        scopes=_req["scope"],
+                                                        usage="userinfo")
+        assert "address" not in _restriction
+        assert "sub" in _restriction
+
+        # So does a client changed in place
+        self.endpoint_context.cdb["client1"]["allowed_scopes"] = ["openid", "address"]
+        _restriction = self.claims_interface.get_claims(session_id=session_id,
+                                                        scopes=_req["scope"],
+                                                        usage="userinfo")
+        assert "address" in _restriction
+
+        # and a changed mapping between scopes and claims
+        self.endpoint_context.scope2claims = dict(self.endpoint_context.scope2claims,
+                                                  address=["locality"])
+        _restriction = self.claims_interface.get_claims(session_id=session_id,
+                                                        scopes=_req["scope"],
+                                                        usage="userinfo")
+        assert "address" not in _restriction
+        assert "locality" in _restriction
+
 
 class TestCollectUserInfoCustomScopes:
     @pytest.fixture(autouse=True)
@@ -412,9 +499,7 @@ class TestCollectUserInfoCustomScopes:
                         "path": "{}/authorization",
                         "class": Authorization,
                         "kwargs": {
-                            "response_types_supported": [
-                                " ".join(x) for x in RESPONSE_TYPES_SUPPORTED
-                            ],
+                            "response_types_supported": RESPONSE_TYPES_SUPPORTED_STR,
                             "response_modes_supported": [
                                 "query",
                                 "fragment",
@@ -484,7 +569,8 @@ class TestCollectUserInfoCustomScopes:
                         "enable_claims_per_client": True
                     },
                 },
-            }
+            },
+            keyjar=KEYJAR,
         )
         self.endpoint_context.cdb["client1"] = {}
         self.session_manager = self.endpoint_context.session_manager
@@ -561,9 +647,7 @@ class TestCollectUserInfoAllowedScopes:
                         "path": "{}/authorization",
                         "class": Authorization,
                         "kwargs": {
-                            "response_types_supported": [
-                                " ".join(x) for x in RESPONSE_TYPES_SUPPORTED
-                            ],
+                            "response_types_supported": RESPONSE_TYPES_SUPPORTED_STR,
                             "response_modes_supported": [
                                 "query",
                                 "fragment",
@@ -574,6 +658,14 @@ class TestCollectUserInfoAllowedScopes:
                             "request_uri_parameter_supported": True,
                         },
                     },
+                    "userinfo": {
+                        "path": "userinfo",
+                        "class": userinfo.UserInfo,
+                        "kwargs": {
+                            "client_authn_method": ["bearer_header"],
+                            "add_claims_by_scope": True,
+                        },
+                    },
                 },
                 "keys": {
                     "public_path": "jwks.json",
@@ -588,80 +680,63 @@ class TestCollectUserInfoAllowedScopes:
                     }
                 },
                 "template_dir": "template",
-            }
+            },
+            keyjar=KEYJAR,
         )
         # Just has to be there
         self.endpoint_context.cdb["client1"] = {
             "allowed_scopes": ['openid', 'email', 'ciao']
         }
+        self.session_manager = self.endpoint_context.session_manager
+        self.claims_interface = ClaimsInterface(self.endpoint_context)
+        self.user_id = "diana"
 
-    def test_collect_user_info(self):
-        _req = OIDR.copy()
-        _req["claims"] = CLAIMS_2
+    def _create_session(self, auth_req, sub_type="public"):
+        ae = create_authn_event(self.user_id)
+        return self.session_manager.create_session(ae, auth_req, self.user_id,
+                                                   client_id=auth_req['client_id'],
+                                                   sub_type=sub_type)
 
-        _session_info = {"authn_req": _req}
-        session = _session_info.copy()
-        session["sub"] = "doe"
-        session["uid"] = "diana"
-        session["authn_event"] = create_authn_event("diana", "salt")
+    def _user_claims(self, auth_req):
+        session_id = self._create_session(auth_req)
+        _restriction = self.claims_interface.get_claims(session_id=session_id,
+                                                        scopes=auth_req["scope"],
+                                                        usage="userinfo")
+        return self.claims_interface.get_user_claims("diana", _restriction)
 
-        res = collect_user_info(self.endpoint_context, session)
+    def test_collect_user_info(self):
+        res = self._user_claims(OIDR_CLAIMS_2)
 
-        assert res == {
-            "nickname": "Dina",
-            "sub": "doe",
-            "email": "diana@example.org",
-            "email_verified": False,
-        }
+        assert res == CLAIMS_2_USERINFO
 
     def test_collect_user_info_2(self):
         _req = OIDR.copy()
-        _req["scope"] = "openid email"
+        _req["scope"] = ["openid", "email"]
         del _req["claims"]
 
-        _session_info = {"authn_req": _req}
-        session = _session_info.copy()
-        session["sub"] = "doe"
-        session["uid"] = "diana"
-        session["authn_event"] = create_authn_event("diana", "salt")
-
         self.endpoint_context.provider_info["scopes_supported"] = [
             "openid",
             "email",
             "offline_access",
         ]
-        res = collect_user_info(self.endpoint_context, session)
+        res = self._user_claims(_req)
 
-        assert res == {
-            "sub": "doe",
-            "email": "diana@example.org",
-            "email_verified": False,
-        }
+        assert res == EMAIL_USERINFO
 
     def test_collect_user_info_scope_not_supported(self):
         _req = OIDR.copy()
-        _req["scope"] = "openid email address"
+        _req["scope"] = ["openid", "email", "address"]
         del _req["claims"]
 
-        _session_info = {"authn_req": _req}
-        session = _session_info.copy()
-        session["sub"] = "doe"
-        session["uid"] = "diana"
-        session["authn_event"] = create_authn_event("diana", "salt")
-
         # Scope address generally supported
         self.endpoint_context.provider_info["scopes_supported"] = [
             "openid",
             "email",
-            "address"
+            "address",
             "offline_access",
         ]
 
         # Scope address not supported for the specific client
-        res = collect_user_info(self.endpoint_context, session)
+        res = self._user_claims(_req)
 
-        assert res == {
-            "sub": "doe",
-            "email": "diana@example.org",
-            "email_verified": False,
-        }
+        assert res == EMAIL_USERINFO
@@ -1,3 +1,4 @@
+import json
 import os
 
 import pytest
@@ -30,6 +31,59 @@ from oidcendpoint.token.handler import factory
 from oidcendpoint.user_authn.authn_context import INTERNETPROTOCOLPASSWORD
 
 
+def auth(session_manager, endpoint_context):
+    # Start with an authentication request
+    # The client ID appears in the request
+    AUTH_REQ = AuthorizationRequest(
+        client_id="client_1",
+        redirect_uri="https://example.com/cb",
+        scope=["openid", "mail", "address", "offline_access"],
+        state="STATE",
+        response_type="code",
+    )
+
+    # The authentication returns a user ID
+    user_id = "diana"
+
+    # User info is stored in the Session DB
+    authn_event = create_authn_event(
+        user_id,
+        authn_info=INTERNETPROTOCOLPASSWORD,
+        authn_time=time_sans_frac(),
+    )
+
+    user_info = UserSessionInfo(user_id=user_id)
+    session_manager.set([user_id], user_info)
+
+    # Now for client session information
+    client_id = AUTH_REQ['client_id']
+    client_info = ClientSessionInfo(client_id=client_id)
+    session_manager.set([user_id, client_id], client_info)
+
+    # The user consent module produces a Grant instance
+
+    grant = Grant(scope=AUTH_REQ['scope'],
+                  resources=[client_id],
+                  authorization_request=AUTH_REQ,
+                  authentication_event=authn_event)
+
+    # the grant is assigned to a session (user_id, client_id)
+    session_id = session_key(user_id, client_id, grant.id)
+    session_manager.set([user_id, client_id, grant.id], grant)
+
+    # Constructing an authorization code is now done by
+
+    code = grant.mint_token(
+        session_id=session_id,
+        endpoint_context=endpoint_context,
+        token_type='authorization_code',
+        token_handler=session_manager.token_handler["code"],
+        expires_at=time_sans_frac() + 300  # 5 minutes from now
+    )
+
+    return grant.id, code
+
+
 class TestSession():
     @pytest.fixture(autouse=True)
     def setup_token_handler(self):
@@ -73,66 +127,14 @@ class TestSession():
             "template_dir": "template",
         }
 
-        self.endpoint_context = EndpointContext(conf)
+        self.endpoint_context = EndpointContext(conf, keyjar=KEYJAR)
         token_handler = factory(self.endpoint_context, **conf["token_handler_args"])
 
         self.session_manager = SessionManager(handler=token_handler)
 
-    def auth(self):
-        # Start with an authentication request
-        # The client ID appears in the request
-        AUTH_REQ = AuthorizationRequest(
-            client_id="client_1",
-            redirect_uri="https://example.com/cb",
-            scope=["openid", "mail", "address", "offline_access"],
-            state="STATE",
-            response_type="code",
-        )
-
-        # The authentication returns a user ID
-        user_id = "diana"
-
-        # User info is stored in the Session DB
-        authn_event = create_authn_event(
-            user_id,
-            authn_info=INTERNETPROTOCOLPASSWORD,
-            authn_time=time_sans_frac(),
-        )
-
-        user_info = UserSessionInfo(user_id=user_id)
-        self.session_manager.set([user_id], user_info)
-
-        # Now for client session information
-        client_id = AUTH_REQ['client_id']
-        client_info = ClientSessionInfo(client_id=client_id)
-        self.session_manager.set([user_id, client_id], client_info)
-
-        # The user consent module produces a Grant instance
-
-        grant = Grant(scope=AUTH_REQ['scope'],
-                      resources=[client_id],
-                      authorization_request=AUTH_REQ,
-                      authentication_event=authn_event)
-
-        # the grant is assigned to a session (user_id, client_id)
-        session_id = session_key(user_id, client_id, grant.id)
-        self.session_manager.set([user_id, client_id, grant.id], grant)
-
-        # Constructing an authorization code is now done by
-
-        code = grant.mint_token(
-            session_id=session_id,
-            endpoint_context=self.endpoint_context,
-            token_type='authorization_code',
-            token_handler= self.session_manager.token_handler["code"],
-            expires_at=time_sans_frac() + 300  # 5 minutes from now
-        )
-
-        return grant.id, code
-
     def test_code_flow(self):
         # code is a Token instance
-        _grant_id, code = self.auth()
+        _grant_id, code = auth(self.session_manager, self.endpoint_context)
 
         # next step is access token request
 
@@ -152,7 +154,7 @@ class TestSession():
         # token I can easily find the grant
 
         # client_info = self.session_manager.get([user_id, TOKEN_REQ['client_id']])
-        tok = self.session_manager.find_token(session_id, TOKEN_REQ['code'])
+        grant, tok = self.session_manager.get_grant_and_token(session_id, TOKEN_REQ['code'])
 
         # Verify that it's of the correct type and can be used
         assert tok.type == "authorization_code"
@@ -162,8 +164,6 @@ class TestSession():
 
         assert tok.supports_minting("access_token")
 
-        grant = self.session_manager[session_id]
-
         access_token = grant.mint_token(
             session_id=session_id,
             endpoint_context=self.endpoint_context,
@@ -215,14 +215,14 @@ class TestSession():
 
 
 KEYDEFS = [
-    {"type": "RSA", "key": "", "use": ["sig"]},
     {"type": "EC", "crv": "P-256", "use": ["sig"]},
 ]
 
 ISSUER = "https://example.com/"
 
 KEYJAR = init_key_jar(key_defs=KEYDEFS, issuer_id=ISSUER)
-KEYJAR.import_jwks(KEYJAR.export_jwks(True, ISSUER), "")
+for _kb in KEYJAR[ISSUER].get_bundles():
+    KEYJAR.add_kb("", _kb)
 RESPONSE_TYPES_SUPPORTED = [
     ["code"],
     ["token"],
@@ -260,6 +260,10 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
+
+
 class TestSessionJWTToken():
     @pytest.fixture(autouse=True)
     def setup_session_manager(self):
@@ -328,7 +332,7 @@ class TestSessionJWTToken():
             "template_dir": "template",
             "userinfo": {
                 "class": user_info.UserInfo,
-                "kwargs": {"db_file": full_path("users.json")},
+                "kwargs": {"db": USERINFO_db},
             },
             "id_token": {"class": IDToken},
         }
@@ -338,63 +342,9 @@ class TestSessionJWTToken():
         # self.session_manager = SessionManager(handler=self.endpoint_context.sdb.handler)
         # self.endpoint_context.session_manager = self.session_manager
 
-    def auth(self):
-        # Start with an authentication request
-        # The client ID appears in the request
-        AUTH_REQ = AuthorizationRequest(
-            client_id="client_1",
-            redirect_uri="https://example.com/cb",
-            scope=["openid", "mail", "address", "offline_access"],
-            state="STATE",
-            response_type="code",
-        )
-
-        # The authentication returns a user ID
-        user_id = "diana"
-
-        # User info is stored in the Session DB
-
-        user_info = UserSessionInfo(user_id=user_id)
-        self.session_manager.set([user_id], user_info)
-
-        # Now for client session information
-        authn_event = create_authn_event(
-            user_id,
-            authn_info=INTERNETPROTOCOLPASSWORD,
-            authn_time=time_sans_frac(),
-        )
-
-        client_id = AUTH_REQ["client_id"]
-        client_info = ClientSessionInfo(client_id=client_id)
-        self.session_manager.set([user_id, client_id], client_info)
-
-        # The user consent module produces a Grant instance
-
-        grant = Grant(
-            scope=AUTH_REQ['scope'],
-            resources=[client_id],
-            authentication_event=authn_event,
-            authorization_request=AUTH_REQ
-        )
-
-        # the grant is assigned to a session (user_id, client_id)
-        session_id = session_key(user_id, client_id, grant.id)
-        self.session_manager.set([user_id, client_id, grant.id], grant)
-
-        # Constructing an authorization code is now done by
-
-        code = grant.mint_token(
-            session_id=session_id,
-            endpoint_context=self.endpoint_context,
-            token_type='authorization_code',
-            token_handler=self.session_manager.token_handler["code"],
-            expires_at=time_sans_frac() + 300  # 5 minutes from now
-        )
-        return code
-
     def test_code_flow(self):
         # code is a Token instance
-        code = self.auth()
+        _grant_id, code = auth(self.session_manager, self.endpoint_context)
 
         # next step is access token request
 
@@ -415,7 +365,7 @@ class TestSessionJWTToken():
         # token I can easily find the grant
 
         # client_info = self.session_manager.get([user_id, TOKEN_REQ['client_id']])
-        tok = self.session_manager.find_token(session_id, TOKEN_REQ['code'])
+        grant, tok = self.session_manager.get_grant_and_token(session_id, TOKEN_REQ['code'])
 
         # Verify that it's of the correct type and can be used
         assert tok.type == "authorization_code"
@@ -429,8 +379,6 @@ class TestSessionJWTToken():
 
         assert tok.supports_minting("access_token")
 
-        grant = self.session_manager[session_id]
-
         access_token = grant.mint_token(
             session_id=session_id,
             endpoint_context=self.endpoint_context,
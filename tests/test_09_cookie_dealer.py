@@ -202,6 +202,15 @@ def test_compute_session_state():
     )
     assert hv == "d21113fbe4b54661ae45f3a3233b0f865ccc646af248274b6fa5664267540e29.salt"
 
+    # Same client, different state
+    hv2 = compute_session_state(
+        "other", "salt", "client_id", "https://example.com/redirect"
+    )
+    assert hv2 != hv
+    assert compute_session_state(
+        "state", "salt", "client_id", "https://example.com/redirect"
+    ) == hv
+
 
 def test_create_session_cookie():
     kaka = create_session_cookie(
@@ -7,7 +7,6 @@ from oidcendpoint.oidc.discovery import Discovery
 from oidcendpoint.user_authn.authn_context import INTERNETPROTOCOLPASSWORD
 
 KEYDEFS = [
-    {"type": "RSA", "key": "", "use": ["sig"]},
     {"type": "EC", "crv": "P-256", "use": ["sig"]},
 ]
 
@@ -55,3 +54,13 @@ class TestEndpoint(object):
                 }
             ],
         }
+
+    def test_do_response_cached(self):
+        args = self.endpoint.process_request({"resource": "acct:foo@example.com"})
+        msg = self.endpoint.do_response(**args)
+        assert ("Cache-Control", "max-age=3600") in msg["http_headers"]
+        assert self.endpoint.do_response(**args)["response"] is msg["response"]
+
+        args = self.endpoint.process_request({"resource": "acct:bar@example.com"})
+        _resp = json.loads(self.endpoint.do_response(**args)["response"])
+        assert _resp["subject"] == "acct:bar@example.com"
@@ -7,23 +7,24 @@ from oidcendpoint.oidc.provider_config import ProviderConfiguration
 from oidcendpoint.oidc.token import Token
 
 KEYDEFS = [
-    {"type": "RSA", "key": "", "use": ["sig"]},
     {"type": "EC", "crv": "P-256", "use": ["sig"]},
 ]
 
-RESPONSE_TYPES_SUPPORTED = [
-    ["code"],
-    ["token"],
-    ["id_token"],
-    ["code", "token"],
-    ["code", "id_token"],
-    ["id_token", "token"],
-    ["code", "token", "id_token"],
-    ["none"],
-]
+RESPONSE_TYPES_SUPPORTED = (
+    "code",
+    "token",
+    "id_token",
+    "code token",
+    "code id_token",
+    "id_token token",
+    "code token id_token",
+    "none",
+)
+
+SUBJECT_TYPES_SUPPORTED = ("public", "pairwise", "ephemeral")
 
 CAPABILITIES = {
-    "response_types_supported": [" ".join(x) for x in RESPONSE_TYPES_SUPPORTED],
+    "response_types_supported": list(RESPONSE_TYPES_SUPPORTED),
     "token_endpoint_auth_methods_supported": [
         "client_secret_post",
         "client_secret_basic",
@@ -31,7 +32,7 @@ CAPABILITIES = {
         "private_key_jwt",
     ],
     "response_modes_supported": ["query", "fragment", "form_post"],
-    "subject_types_supported": ["public", "pairwise""ephemeral"],
+    "subject_types_supported": list(SUBJECT_TYPES_SUPPORTED),
     "grant_types_supported": [
         "authorization_code",
         "implicit",
@@ -100,4 +101,5 @@ class TestEndpoint(object):
             "updated_at",
             "birthdate",
         }
+        assert _msg["subject_types_supported"] == list(SUBJECT_TYPES_SUPPORTED)
         assert ("Content-type", "application/json; charset=utf-8") in msg["http_headers"]
@@ -22,6 +22,7 @@ from oidcendpoint.authn_event import create_authn_event
 from oidcendpoint.authz import AuthzHandling
 from oidcendpoint.cookie import CookieDealer
 from oidcendpoint.endpoint_context import EndpointContext
+from oidcendpoint.exception import FailedAuthentication
 from oidcendpoint.exception import InvalidRequest
 from oidcendpoint.exception import NoSuchAuthentication
 from oidcendpoint.exception import RedirectURIError
@@ -31,6 +32,7 @@ from oidcendpoint.exception import UnknownClient
 from oidcendpoint.id_token import IDToken
 from oidcendpoint.oauth2.authorization import FORM_POST
 from oidcendpoint.oauth2.authorization import Authorization
+from oidcendpoint.oauth2.authorization import authn_args_gather
 from oidcendpoint.oauth2.authorization import get_uri
 from oidcendpoint.oauth2.authorization import inputs
 from oidcendpoint.oauth2.authorization import join_query
@@ -70,7 +72,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO_db = json.loads(open(full_path("users.json")).read())
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
 
 
 class SimpleCookieDealer(object):
@@ -255,6 +258,38 @@ class TestEndpoint(object):
             "session_id"
         }
 
+    def test_process_request_verify_uri_once(self, monkeypatch):
+        from oidcendpoint.oauth2 import authorization
+
+        _calls = []
+
+        def _verify_uri(*args, **kwargs):
+            _calls.append(args)
+            return verify_uri(*args, **kwargs)
+
+        monkeypatch.setattr(authorization, "verify_uri", _verify_uri)
+        _pr_resp = self.endpoint.parse_request(AUTH_REQ_DICT)
+        _resp = self.endpoint.process_request(_pr_resp)
+        assert _resp["return_uri"] == AUTH_REQ["redirect_uri"]
+        assert len(_calls) == 1
+
+    def test_process_request_unparsed_redirect_uri(self):
+        _req = AuthorizationRequest(**AUTH_REQ_DICT)
+        _req["redirect_uri"] = "https://rp.example.org/cb"
+        _resp = self.endpoint.process_request(_req)
+        assert "return_uri" not in _resp
+        assert _resp["response_args"]["error"] == "invalid_request"
+
+    def test_process_request_authn_failure(self, caplog):
+        def _fail(**kwargs):
+            raise FailedAuthentication("Wrong password")
+
+        self.endpoint.setup_auth = lambda *args, **kwargs: {"function": _fail, "args": {}}
+        _pr_resp = self.endpoint.parse_request(AUTH_REQ_DICT)
+        _resp = self.endpoint.process_request(_pr_resp)
+        assert _resp == {"http_response": "Internal error: Wrong password"}
+        assert not [r for r in caplog.records if r.exc_info]
+
     def test_do_response_code(self):
         _pr_resp = self.endpoint.parse_request(AUTH_REQ_DICT)
         _resp = self.endpoint.process_request(_pr_resp)
@@ -279,6 +314,63 @@ class TestEndpoint(object):
         assert isinstance(_pr_resp, AuthorizationErrorResponse)
         assert _pr_resp["error"] == "invalid_request"
 
+    def test_parse_unknown_client(self):
+        _req = AUTH_REQ_DICT.copy()
+        _req["client_id"] = "client_X"
+        _pr_resp = self.endpoint.parse_request(_req)
+        assert isinstance(_pr_resp, AuthorizationErrorResponse)
+        assert _pr_resp["error"] == "unauthorized_client"
+
+        # A client added to the client database by other means is accepted
+        _cdb = self.endpoint.endpoint_context.cdb
+        _cdb["client_X"] = _cdb["client_1"]
+        _pr_resp = self.endpoint.parse_request(_req)
+        assert isinstance(_pr_resp, AuthorizationRequest)
+
+    def test_allowed_request_algorithms(self):
+        _ec = self.endpoint.endpoint_context
+        _ec.cdb["client_1"]["request_object_signing_alg"] = ["RS256"]
+        _ec.cdb["client_1"]["request_object_encryption_alg"] = ["RSA-OAEP"]
+        _ec.cdb["client_1"]["request_object_encryption_enc"] = ["A128GCM"]
+        _check = self.endpoint.allowed_request_algorithms.check_many
+
+        _check(
+            "client_1",
+            _ec,
+            {"sign": "RS256", "enc_alg": "RSA-OAEP", "enc_enc": "A128GCM"},
+        )
+        with pytest.raises(ValueError):
+            _check(
+                "client_1",
+                _ec,
+                {"sign": "RS256", "enc_alg": "RSA-OAEP", "enc_enc": "A256GCM"},
+            )
+
+        # Updated client registration
+        _ec.cdb["client_1"]["request_object_encryption_enc"] = ["A256GCM"]
+        _check(
+            "client_1",
+            _ec,
+            {"sign": "RS256", "enc_alg": "RSA-OAEP", "enc_enc": "A256GCM"},
+        )
+
+    def test_allowed_request_algorithms_registered_string(self):
+        _ec = self.endpoint.endpoint_context
+        # Registration stores the *_alg and *_enc values as single strings
+        _ec.cdb["client_1"]["request_object_signing_alg"] = "RS256"
+        _ec.cdb["client_1"]["request_object_encryption_alg"] = "RSA-OAEP"
+        _ec.cdb["client_1"]["request_object_encryption_enc"] = "A128GCM"
+        _check = self.endpoint.allowed_request_algorithms.check_many
+
+        _check(
+            "client_1",
+            _ec,
+            {"sign": "RS256", "enc_alg": "RSA-OAEP", "enc_enc": "A128GCM"},
+        )
+        self.endpoint.allowed_request_algorithms("client_1", _ec, "RS256", "sign")
+        with pytest.raises(ValueError):
+            self.endpoint.allowed_request_algorithms("client_1", _ec, "RS", "sign")
+
     def test_verify_uri_unknown_client(self):
         request = {"redirect_uri": "https://rp.example.com/cb"}
         with pytest.raises(UnknownClient):
@@ -371,6 +463,35 @@ class TestEndpoint(object):
         with pytest.raises(ValueError):
             verify_uri(_ec, request, "redirect_uri", "client_id")
 
+    def test_verify_uri_client_update(self):
+        _ec = self.endpoint.endpoint_context
+        _ec.cdb["client_id"] = {"redirect_uris": [("https://rp.example.com/cb", {})]}
+
+        request = {"redirect_uri": "https://rp.example.com/cb"}
+        verify_uri(_ec, request, "redirect_uri", "client_id")
+
+        _ec.cdb["client_id"] = {
+            "redirect_uris": [("https://rp.example.com/auth_cb", {})]
+        }
+        with pytest.raises(RedirectURIError):
+            verify_uri(_ec, request, "redirect_uri", "client_id")
+
+    def test_verify_uri_client_update_in_place(self):
+        _ec = self.endpoint.endpoint_context
+        _ec.cdb["client_id"] = {
+            "redirect_uris": [
+                ("https://rp.example.com/cb", {}),
+                ("https://rp.example.com/auth_cb", {}),
+            ]
+        }
+
+        request = {"redirect_uri": "https://rp.example.com/cb"}
+        verify_uri(_ec, request, "redirect_uri", "client_id")
+
+        del _ec.cdb["client_id"]["redirect_uris"][0]
+        with pytest.raises(RedirectURIError):
+            verify_uri(_ec, request, "redirect_uri", "client_id")
+
     def test_get_uri(self):
         _ec = self.endpoint.endpoint_context
         _ec.cdb["client_id"] = {"redirect_uris": [("https://rp.example.com/cb", {})]}
@@ -457,6 +578,31 @@ class TestEndpoint(object):
         res = self.endpoint.setup_auth(request, redirect_uri, cinfo, kaka)
         assert set(res.keys()) == {"session_id", "identity", "user"}
 
+    def test_setup_auth_plain_uid(self):
+        request = AuthorizationRequest(
+            client_id="client_id",
+            redirect_uri="https://rp.example.com/cb",
+            response_type=["id_token"],
+            state="state",
+            nonce="nonce",
+            scope="openid",
+        )
+        redirect_uri = request["redirect_uri"]
+        cinfo = {
+            "client_id": "client_id",
+            "redirect_uris": [("https://rp.example.com/cb", {})],
+            "id_token_signed_response_alg": "RS256",
+        }
+
+        # Both are made up of base64 characters but are not base64 encoded JSON
+        for uid in ["dianab", "eyeball"]:
+            item = self.endpoint.endpoint_context.authn_broker.db["anon"]
+            item["method"].user = uid
+
+            res = self.endpoint.setup_auth(request, redirect_uri, cinfo, None)
+            assert set(res.keys()) == {"session_id", "identity", "user"}
+            assert res["user"] == uid
+
     def test_setup_auth_error(self):
         request = AuthorizationRequest(
             client_id="client_id",
@@ -595,6 +741,18 @@ class TestEndpoint(object):
             inputs='<input type="hidden" name="foo" value="bar"/>',
         )
 
+    def test_response_mode_form_post_escaped_action(self):
+        request = {"response_mode": "form_post"}
+        info = {
+            "response_args": AuthorizationResponse(foo="bar"),
+            "return_uri": "https://example.com/cb?a=b&c=d",
+        }
+        info = self.endpoint.response_mode(request, **info)
+        assert info["response_msg"] == FORM_POST.format(
+            action="https://example.com/cb?a=b&amp;c=d",
+            inputs='<input type="hidden" name="foo" value="bar"/>',
+        )
+
     def test_response_mode_fragment(self):
         request = {"response_mode": "fragment"}
         self.endpoint.response_mode(request, fragment_enc=True)
@@ -639,6 +797,19 @@ def test_inputs():
     assert test_elems[0] in elems and test_elems[1] in elems
 
 
+def test_inputs_escaped():
+    elems = inputs({"state": '"/><script>alert(1)</script>'})
+    assert elems == (
+        '<input type="hidden" name="state" '
+        'value="&quot;/&gt;&lt;script&gt;alert(1)&lt;/script&gt;"/>'
+    )
+
+
+def test_authn_args_gather_query():
+    _args = authn_args_gather(AUTH_REQ, "acr", {})
+    assert parse_qs(_args["query"]) == parse_qs(AUTH_REQ.to_urlencoded())
+
+
 def test_join_query():
     redirect_uris = [("https://rp.example.com/cb", {"foo": ["bar"], "state": ["low"]})]
     uri = join_query(*redirect_uris[0])
@@ -52,7 +52,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO_db = json.loads(open(full_path("users.json")).read())
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
 
 
 class SimpleCookieDealer(object):
@@ -229,3 +230,80 @@ class TestEndpoint(object):
             )
 
         assert "__verified_request" in _req
+
+    def test_parse_request_uri_cached(self):
+        _jwt = JWT(key_jar=self.rp_keyjar, iss="client_1", sign_alg="HS256")
+        _jws = _jwt.pack(
+            AUTH_REQ_DICT, aud=self.endpoint.endpoint_context.provider_info["issuer"]
+        )
+
+        request_uri = "https://client.example.com/req"
+        _areq = {
+            "request_uri": request_uri,
+            "redirect_uri": AUTH_REQ.get("redirect_uri"),
+            "response_type": AUTH_REQ.get("response_type"),
+            "client_id": AUTH_REQ.get("client_id"),
+            "scope": AUTH_REQ.get("scope"),
+        }
+        # -----------------
+        with responses.RequestsMock() as rsps:
+            rsps.add("GET", request_uri, body=_jws, status=200)
+            _req = self.endpoint.parse_request(_areq)
+            assert "__verified_request" in _req
+            # The second time around the request object is not fetched again
+            _req = self.endpoint.parse_request(_areq)
+            assert "__verified_request" in _req
+            assert len(rsps.calls) == 1
+
+    def test_parse_request_uri_cached_alg_narrowed(self):
+        _jwt = JWT(key_jar=self.rp_keyjar, iss="client_1", sign_alg="HS256")
+        _jws = _jwt.pack(
+            AUTH_REQ_DICT, aud=self.endpoint.endpoint_context.provider_info["issuer"]
+        )
+
+        request_uri = "https://client.example.com/req"
+        _areq = {
+            "request_uri": request_uri,
+            "redirect_uri": AUTH_REQ.get("redirect_uri"),
+            "response_type": AUTH_REQ.get("response_type"),
+            "client_id": AUTH_REQ.get("client_id"),
+            "scope": AUTH_REQ.get("scope"),
+        }
+        # -----------------
+        with responses.RequestsMock() as rsps:
+            rsps.add("GET", request_uri, body=_jws, status=200)
+            self.endpoint.parse_request(_areq)
+
+        # The cached request object is checked against the client's present
+        # registration
+        _cdb = self.endpoint.endpoint_context.cdb
+        _cdb["client_1"]["request_object_signing_alg"] = "RS256"
+        with pytest.raises(ValueError):
+            self.endpoint.parse_request(_areq)
+
+    def test_parse_request_uri_not_modified(self):
+        _jwt = JWT(key_jar=self.rp_keyjar, iss="client_1", sign_alg="HS256")
+        _jws = _jwt.pack(
+            AUTH_REQ_DICT, aud=self.endpoint.endpoint_context.provider_info["issuer"]
+        )
+
+        request_uri = "https://client.example.com/req"
+        _areq = {
+            "request_uri": request_uri,
+            "redirect_uri": AUTH_REQ.get("redirect_uri"),
+            "response_type": AUTH_REQ.get("response_type"),
+            "client_id": AUTH_REQ.get("client_id"),
+            "scope": AUTH_REQ.get("scope"),
+        }
+        # -----------------
+        with responses.RequestsMock() as rsps:
+            rsps.add("GET", request_uri, body=_jws, status=200, headers={"ETag": '"1"'})
+            self.endpoint.parse_request(_areq)
+
+        self.endpoint._req_uri_cache.clear()
+        with responses.RequestsMock() as rsps:
+            rsps.add("GET", request_uri, status=304)
+            _req = self.endpoint.parse_request(_areq)
+            assert rsps.calls[0].request.headers["If-None-Match"] == '"1"'
+
+        assert "__verified_request" in _req
@@ -107,7 +107,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO_db = json.loads(open(full_path("users.json")).read())
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
 
 client_yaml = """
 oidc_clients:
@@ -582,6 +583,71 @@ class TestEndpoint(object):
         resp = self.endpoint.create_authn_response(request, session_id)
         assert isinstance(resp["response_args"], AuthorizationErrorResponse)
 
+    def test_create_authn_response_grant_stored_before_id_token(self):
+        request = AuthorizationRequest(
+            client_id="client_id",
+            redirect_uri="https://rp.example.com/cb",
+            response_type=["code", "id_token"],
+            state="state",
+            nonce="nonce",
+            scope="openid",
+        )
+
+        _ec = self.endpoint.endpoint_context
+        _ec.cdb["client_id"] = {
+            "client_id": "client_id",
+            "redirect_uris": [("https://rp.example.com/cb", {})],
+            "id_token_signed_response_alg": "RS256",
+        }
+
+        session_id = self._create_session(request)
+
+        # With an external session store the ID Token can only see the code
+        # if the grant has been stored before the ID Token is made
+        _calls = []
+        _mngr = _ec.session_manager
+        _set = _mngr.set
+        _make = _ec.idtoken.make
+
+        def _record_set(path, value):
+            _calls.append("set")
+            return _set(path, value)
+
+        def _record_make(*args, **kwargs):
+            _calls.append("make")
+            return _make(*args, **kwargs)
+
+        _mngr.set = _record_set
+        _ec.idtoken.make = _record_make
+
+        resp = self.endpoint.create_authn_response(request, session_id)
+        assert "id_token" in resp["response_args"]
+        assert _calls.index("set") < _calls.index("make")
+
+    def test_post_authentication_verifies_redirect_uri(self):
+        request = AuthorizationRequest(
+            client_id="client_id",
+            redirect_uri="https://rp.example.org/cb",
+            response_type=["code"],
+            state="state",
+            scope="openid",
+        )
+
+        _ec = self.endpoint.endpoint_context
+        _ec.cdb["client_id"] = {
+            "client_id": "client_id",
+            "redirect_uris": [("https://rp.example.com/cb", {})],
+        }
+
+        session_id = self._create_session(request)
+
+        # A keyword argument can not stand in for the verification
+        resp = self.endpoint.authz_part2(
+            request, session_id, verified_redirect_uri=request["redirect_uri"]
+        )
+        assert "return_uri" not in resp
+        assert resp["response_args"]["error"] == "invalid_request"
+
     def test_setup_auth(self):
         request = AuthorizationRequest(
             client_id="client_id",
@@ -737,6 +803,8 @@ class TestEndpoint(object):
         _pr_resp = self.endpoint.parse_request(AUTH_REQ_DICT)
         _resp = self.endpoint.process_request(_pr_resp)
         assert "session_state" in _resp["response_args"]
+        assert isinstance(_resp["cookie"], list)
+        assert len(_resp["cookie"]) == 2
 
     def test_setup_auth_login_hint(self):
         request = AuthorizationRequest(
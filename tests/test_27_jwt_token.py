@@ -1,7 +1,9 @@
+import json
 import os
 
 import pytest
 from cryptojwt.jwt import JWT
+from cryptojwt.utils import b64e
 from cryptojwt.key_jar import init_key_jar
 from oidcmsg.oidc import AccessTokenRequest
 from oidcmsg.oidc import AuthorizationRequest
@@ -12,6 +14,7 @@ from oidcendpoint.authn_event import create_authn_event
 from oidcendpoint.authz import AuthzHandling
 from oidcendpoint.client_authn import verify_client
 from oidcendpoint.endpoint_context import EndpointContext
+from oidcendpoint.exception import ToOld
 from oidcendpoint.id_token import IDToken
 from oidcendpoint.oauth2.introspection import Introspection
 from oidcendpoint.oidc.authorization import Authorization
@@ -20,6 +23,7 @@ from oidcendpoint.oidc.registration import Registration
 from oidcendpoint.oidc.session import Session
 from oidcendpoint.oidc.token import Token
 from oidcendpoint.session import session_key
+from oidcendpoint.token.exception import UnknownToken
 from oidcendpoint.user_authn.authn_context import INTERNETPROTOCOLPASSWORD
 
 KEYDEFS = [
@@ -30,7 +34,8 @@ KEYDEFS = [
 ISSUER = "https://example.com/"
 
 KEYJAR = init_key_jar(key_defs=KEYDEFS, issuer_id=ISSUER)
-KEYJAR.import_jwks(KEYJAR.export_jwks(True, ISSUER), "")
+for _kb in KEYJAR[ISSUER].get_bundles():
+    KEYJAR.add_kb("", _kb)
 
 RESPONSE_TYPES_SUPPORTED = [
     ["code"],
@@ -95,6 +100,10 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
+
+
 class TestEndpoint(object):
     @pytest.fixture(autouse=True)
     def create_endpoint(self):
@@ -164,7 +173,7 @@ class TestEndpoint(object):
             "template_dir": "template",
             "userinfo": {
                 "class": user_info.UserInfo,
-                "kwargs": {"db_file": full_path("users.json")},
+                "kwargs": {"db": USERINFO_db},
             },
             "id_token": {"class": IDToken},
             "authz": {
@@ -278,3 +287,26 @@ class TestEndpoint(object):
         assert access_token.is_active()
         # 4000 seconds in the future. Passed the lifetime.
         assert access_token.is_active(now=time_sans_frac() + 4000) is False
+
+    def test_info_reused_verifier(self):
+        session_id = self._create_session(AUTH_REQ)
+        grant = self.endpoint_context.authz(session_id=session_id, request=AUTH_REQ)
+        code = self._mint_token("authorization_code", grant, session_id)
+        first = self._mint_token("access_token", grant, session_id, code)
+        second = self._mint_token("access_token", grant, session_id, code, scope=["openid"])
+
+        _handler = self.session_manager.token_handler["access_token"]
+        assert _handler.info(first.value)["sid"] == session_id
+        assert _handler.info(second.value)["sid"] == session_id
+        assert _handler.is_expired(second.value) is False
+
+    def test_forged_expired_token(self):
+        _handler = self.session_manager.token_handler["access_token"]
+        _payload = b64e(b'{"sid": "x", "ttype": "T", "exp": 10}').decode()
+        _token = "eyJhbGciOiJFUzI1NiJ9.{}.c2lnbmF0dXJl".format(_payload)
+
+        # The signature is checked before the expiration time
+        with pytest.raises(UnknownToken):
+            _handler.info(_token)
+        with pytest.raises(UnknownToken):
+            _handler.is_expired(_token)
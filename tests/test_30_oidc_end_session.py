@@ -5,9 +5,11 @@ from urllib.parse import parse_qs
 from urllib.parse import urlparse
 
 import pytest
+import requests
 import responses
 from cryptojwt import as_unicode
 from cryptojwt import b64d
+from cryptojwt.key_jar import KeyJar
 from cryptojwt.key_jar import build_keyjar
 from cryptojwt.utils import as_bytes
 from oidcmsg.exception import InvalidRequest
@@ -100,7 +102,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO_db = json.loads(open(full_path("users.json")).read())
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
 
 
 class TestEndpoint(object):
@@ -273,6 +276,44 @@ class TestEndpoint(object):
         assert jwt_info["sid"] == _session_info["session_id"]
         assert jwt_info["redirect_uri"] == "https://example.com/post_logout"
 
+    def test_end_session_endpoint_verify_url_with_query(self):
+        _resp = self._code_auth("1234567")
+        _code = _resp["response_args"]["code"]
+        _session_info = self.session_manager.get_session_info_by_token(_code)
+        cookie = self._create_cookie(_session_info["session_id"])
+
+        _endpoint = Session(
+            self.session_endpoint.endpoint_context,
+            post_logout_uri_path="post_logout",
+            signing_alg="ES256",
+            logout_verify_url="{}/verify_logout?lang=en".format(ISS),
+            client_authn_method=None,
+        )
+        _req_args = _endpoint.parse_request({"state": "1234567"})
+        resp = _endpoint.process_request(_req_args, cookie=cookie)
+
+        p = urlparse(resp["redirect_location"])
+        qs = parse_qs(p.query)
+        assert qs["lang"] == ["en"]
+        jwt_info = _endpoint.unpack_signed_jwt(qs["sjwt"][0])
+        assert jwt_info["redirect_uri"] == "https://example.com/post_logout"
+
+    def test_end_session_endpoint_no_post_logout_uri_path(self):
+        _resp = self._code_auth("1234567")
+        _code = _resp["response_args"]["code"]
+        _session_info = self.session_manager.get_session_info_by_token(_code)
+        cookie = self._create_cookie(_session_info["session_id"])
+
+        _endpoint = Session(
+            self.session_endpoint.endpoint_context,
+            signing_alg="ES256",
+            logout_verify_url="{}/verify_logout".format(ISS),
+            client_authn_method=None,
+        )
+        _req_args = _endpoint.parse_request({"state": "1234567"})
+        with pytest.raises(KeyError):
+            _endpoint.process_request(_req_args, cookie=cookie)
+
     def test_end_session_endpoint_with_cookie_and_unknown_sid(self):
         # Need cookie and ID Token to figure this out
         resp_args, _session_id = self._auth_with_id_token("1234567")
@@ -393,6 +434,31 @@ class TestEndpoint(object):
         assert _jwt["aud"] == ["client_1"]
         assert "sid" in _jwt
 
+        res2 = self.session_endpoint.do_back_channel_logout(_cdb, "_sid_")
+        _jwt2 = self.session_endpoint.unpack_signed_jwt(res2[1], "RS256")
+        assert _jwt2["jti"] != _jwt["jti"]
+
+    def test_get_signer(self):
+        _signer = self.session_endpoint._get_signer("RS256")
+        assert self.session_endpoint._get_signer("RS256") is _signer
+        assert self.session_endpoint._get_signer("RS256", with_jti=True) is not _signer
+
+        self.session_endpoint.endpoint_context.keyjar = KeyJar()
+        assert self.session_endpoint._get_signer("RS256") is not _signer
+
+    def test_encrypt_sid(self):
+        _enc = self.session_endpoint._encrypt_sid("_sid_")
+        assert self.session_endpoint._decrypt_sid(_enc) == "_sid_"
+        # A new nonce every time
+        assert self.session_endpoint._encrypt_sid("_sid_") != _enc
+        _enc = self.session_endpoint._encrypt_sid("björn;client_1;grant")
+        assert self.session_endpoint._decrypt_sid(_enc) == "björn;client_1;grant"
+
+        self.session_endpoint.endpoint_context.symkey = "another symmetric key 24"
+        _enc2 = self.session_endpoint._encrypt_sid("_sid_")
+        assert _enc2 != _enc
+        assert self.session_endpoint._decrypt_sid(_enc2) == "_sid_"
+
     def test_front_channel_logout(self):
         self._code_auth("1234567")
 
@@ -436,6 +502,11 @@ class TestEndpoint(object):
         for i in test_res:
             assert i in res
 
+        # The parsed URI is reused, the query of the first call must not stick
+        res = do_front_channel_logout_iframe(_cdb, ISS, "_sid2_")
+        assert "sid=_sid2_" in res
+        assert res.count("sid=") == 1
+
     def test_logout_from_client_bc(self):
         _resp = self._code_auth("1234567")
         _code = _resp["response_args"]["code"]
@@ -519,7 +590,11 @@ class TestEndpoint(object):
         _cinfo = self.session_manager[session_key(self.user_id, "client_2")]
         assert _cinfo.is_revoked()
 
-    def test_do_verified_logout(self):
+    def test_do_verified_logout(self, monkeypatch):
+        from oidcendpoint.oidc import session
+
+        # A single client is logged out without a thread pool
+        monkeypatch.setattr(session, "ThreadPoolExecutor", None)
         with responses.RequestsMock() as rsps:
             rsps.add("POST", "https://example.com/bc_logout", body="OK", status=200)
 
@@ -532,6 +607,60 @@ class TestEndpoint(object):
 
             res = self.session_endpoint.do_verified_logout(_session_info["session_id"])
             assert res == []
+            assert len(rsps.calls) == 1
+
+    def test_do_verified_logout_all(self):
+        with responses.RequestsMock() as rsps:
+            rsps.add("POST", "https://example.com/bc_logout", body="OK", status=200)
+            rsps.add("POST", "https://example.com/bc_logout2", body="OK", status=200)
+
+            _resp = self._code_auth("1234567")
+            _code = _resp["response_args"]["code"]
+            _session_info = self.session_manager.get_session_info_by_token(_code)
+            self._code_auth2("abcdefg")
+
+            _cdb = self.session_endpoint.endpoint_context.cdb
+            _cdb["client_1"]["backchannel_logout_uri"] = "https://example.com/bc_logout"
+            _cdb["client_1"]["client_id"] = "client_1"
+            _cdb["client_2"]["backchannel_logout_uri"] = "https://example.com/bc_logout2"
+            _cdb["client_2"]["client_id"] = "client_2"
+
+            res = self.session_endpoint.do_verified_logout(
+                _session_info["session_id"], alla=True
+            )
+            assert res == []
+            assert len(rsps.calls) == 2
+
+    def test_do_verified_logout_all_deployer_httpc(self, monkeypatch):
+        from oidcendpoint.oidc import session
+
+        # A HTTP client supplied by the deployer is not assumed to be
+        # thread safe, so the clients are logged out one at a time.
+        monkeypatch.setattr(session, "ThreadPoolExecutor", None)
+        _context = self.session_endpoint.endpoint_context
+        monkeypatch.setattr(_context, "httpc", requests.Session())
+        assert _context.httpc_is_thread_safe() is False
+
+        with responses.RequestsMock() as rsps:
+            rsps.add("POST", "https://example.com/bc_logout", body="OK", status=200)
+            rsps.add("POST", "https://example.com/bc_logout2", body="OK", status=200)
+
+            _resp = self._code_auth("1234567")
+            _code = _resp["response_args"]["code"]
+            _session_info = self.session_manager.get_session_info_by_token(_code)
+            self._code_auth2("abcdefg")
+
+            _cdb = _context.cdb
+            _cdb["client_1"]["backchannel_logout_uri"] = "https://example.com/bc_logout"
+            _cdb["client_1"]["client_id"] = "client_1"
+            _cdb["client_2"]["backchannel_logout_uri"] = "https://example.com/bc_logout2"
+            _cdb["client_2"]["client_id"] = "client_2"
+
+            res = self.session_endpoint.do_verified_logout(
+                _session_info["session_id"], alla=True
+            )
+            assert res == []
+            assert len(rsps.calls) == 2
 
     def test_logout_from_client_unknow_sid(self):
         _resp = self._code_auth("1234567")
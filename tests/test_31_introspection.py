@@ -93,6 +93,10 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
+with open(full_path("users.json")) as fp:
+    USERINFO_db = json.load(fp)
+
+
 @pytest.mark.parametrize("jwt_token", [True, False])
 class TestEndpoint:
     @pytest.fixture(autouse=True)
@@ -157,7 +161,7 @@ class TestEndpoint:
             "userinfo": {
                 "path": "{}/userinfo",
                 "class": UserInfo,
-                "kwargs": {"db_file": full_path("users.json")},
+                "kwargs": {"db": USERINFO_db},
             },
             "client_authn": verify_client,
             "template_dir": "template",
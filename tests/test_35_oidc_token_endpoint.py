@@ -83,7 +83,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO = UserInfo(json.loads(open(full_path("users.json")).read()))
+with open(full_path("users.json")) as fp:
+    USERINFO = UserInfo(json.load(fp))
 
 
 @pytest.fixture
@@ -74,7 +74,8 @@ def full_path(local_file):
     return os.path.join(BASEDIR, local_file)
 
 
-USERINFO = UserInfo(json.loads(open(full_path("users.json")).read()))
+with open(full_path("users.json")) as fp:
+    USERINFO = UserInfo(json.load(fp))
 
 ENDPOINT_CONTEXT_CONFIG = {
     "issuer": "https://example.com/",
@@ -119,7 +120,7 @@ ENDPOINT_CONTEXT_CONFIG = {
     },
     "userinfo": {
         "class": user_info.UserInfo,
-        "kwargs": {"db_file": full_path("users.json")},
+        "kwargs": {"db": USERINFO.db},
     },
     # "client_authn": verify_client,
     "authentication": {